@@ -0,0 +1,27 @@
+# Script for benchmarking the PC-side hot paths of the robot control.
+
+import timeit
+
+import ev3
+
+
+def bench(name, stmt, number=100000):
+    t = min(timeit.repeat(stmt, number=number, repeat=5, globals=globals())) / number
+    print('%-40s %8.1fns' % (name, t * 1e9))
+
+
+# Typical operands of the move commands: powers, motor degrees, waits and global variables
+LC_VALUES = [0, 1, 15, 54, 100, -100, 108, -9, 22, 76]
+GV_VALUES = [0, 4, 8]
+
+def bench_encoding():
+    bench('LCX (precomputed)', 'for v in LC_VALUES: ev3.LCX(v)')
+    bench('LCX (direct)', 'for v in LC_VALUES: ev3._encode_lcx(v)')
+    bench('GVX (precomputed)', 'for v in GV_VALUES: ev3.GVX(v)')
+    bench('GVX (direct)', 'for v in GV_VALUES: ev3._encode_gvx(v)')
+    bench('LVX (precomputed)', 'for v in GV_VALUES: ev3.LVX(v)')
+    bench('LVX (direct)', 'for v in GV_VALUES: ev3._encode_lvx(v)')
+
+
+if __name__ == '__main__':
+    bench_encoding()
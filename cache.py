@@ -0,0 +1,147 @@
+# On-disk cache of already computed solutions, which allows skipping the solver entirely for
+# positions that we have seen before (like repeated demo scrambles).
+
+from collections import OrderedDict
+import mmap
+import os
+import struct
+
+N_FACELETS = 54
+FACES = 'URFDLB'
+NORMALS = [(0, 1, 0), (1, 0, 0), (0, 0, 1), (0, -1, 0), (-1, 0, 0), (0, 0, -1)]
+
+# Position of a facelet's cubie in a coordinate system with x to the right, y up and z to the front
+def facelet_pos(face, row, col):
+    return [
+        (col - 1, 1, row - 1),
+        (1, 1 - row, 1 - col),
+        (col - 1, 1 - row, 1),
+        (col - 1, -1, 1 - row),
+        (-1, 1 - row, col - 1),
+        (1 - col, 1 - row, -1)
+    ][face]
+
+# Unique location of every facelet: its cubie's position shifted by half a unit in the face direction
+LOCS = [
+    tuple(2 * p + n for p, n in zip(facelet_pos(f, i // 3, i % 3), NORMALS[f]))
+    for f in range(len(FACES)) for i in range(9)
+]
+LOC_TO_FACELET = {loc: i for i, loc in enumerate(LOCS)}
+
+def apply(mat, v):
+    return tuple(sum(mat[i][j] * v[j] for j in range(3)) for i in range(3))
+
+def mul(mat1, mat2):
+    return [[sum(mat1[i][k] * mat2[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+
+# The robot cannot turn B, hence we may only use the symmetries that keep B in place, i.e. the
+# rotations around the F-B axis and their mirrored versions
+ROT = [[0, -1, 0], [1, 0, 0], [0, 0, 1]]
+MIRROR = [[-1, 0, 0], [0, 1, 0], [0, 0, 1]]
+SYMS = [[[int(i == j) for j in range(3)] for i in range(3)]]
+for _ in range(3):
+    SYMS.append(mul(ROT, SYMS[-1]))
+SYMS += [mul(sym, MIRROR) for sym in SYMS]
+N_SYMS = len(SYMS)
+
+SYM_PERM = [[LOC_TO_FACELET[apply(sym, loc)] for loc in LOCS] for sym in SYMS]
+SYM_FACES = [[NORMALS.index(apply(sym, n)) for n in NORMALS] for sym in SYMS]
+SYM_MIRRORED = [i >= N_SYMS // 2 for i in range(N_SYMS)] # mirrored symmetries invert all turns
+SYM_INV = [SYM_PERM.index(sorted(range(N_FACELETS), key=perm.__getitem__)) for perm in SYM_PERM]
+
+def transform(facecube, s):
+    tmp = [''] * N_FACELETS
+    for i, c in enumerate(facecube):
+        tmp[SYM_PERM[s][i]] = FACES[SYM_FACES[s][FACES.index(c)]]
+    return ''.join(tmp)
+
+# Map a move ID (in the solver's numbering, see `solve.NAME_TO_MOVE`) to its symmetric move
+def transform_move(m, s):
+    face = SYM_FACES[s][m // 3]
+    return 3 * face + (2 - m % 3 if SYM_MIRRORED[s] else m % 3)
+
+MAX_LEN = 48
+# Every slot: facecube, solution length, move IDs, last-used stamp
+RECORD = struct.Struct('<%dsB%dsQ' % (N_FACELETS, MAX_LEN))
+
+
+# Memory-mapped, fixed-size solution cache with LRU eviction. With `symmetry`, positions are
+# stored under a canonical representative of all their symmetric versions.
+class SolutionCache:
+
+    def __init__(self, path, size=4096, symmetry=True):
+        self.symmetry = symmetry
+        if not os.path.exists(path) or os.path.getsize(path) != size * RECORD.size:
+            with open(path, 'wb') as f:
+                f.write(bytes(size * RECORD.size))
+        self.file = open(path, 'r+b')
+        self.mem = mmap.mmap(self.file.fileno(), 0)
+
+        self.index = OrderedDict() # canonical facecube -> slot, least recently used first
+        self.free = []
+        entries = []
+        for slot in range(size):
+            key, _, _, stamp = RECORD.unpack_from(self.mem, slot * RECORD.size)
+            if key[0] == 0:
+                self.free.append(slot)
+            else:
+                entries.append((stamp, key.decode(), slot))
+        entries.sort()
+        for _, key, slot in entries:
+            self.index[key] = slot
+        self.stamp = entries[-1][0] + 1 if entries else 1
+        self.free.reverse() # fill up slots in order
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    # Returns canonical facecube and the symmetry mapping the given one to it
+    def canonical(self, facecube):
+        if not self.symmetry:
+            return facecube, 0
+        return min((transform(facecube, s), s) for s in range(N_SYMS))
+
+    def get(self, facecube):
+        if len(facecube) != N_FACELETS:
+            return None
+        key, s = self.canonical(facecube)
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+        self.index.move_to_end(key)
+
+        _, n, moves, _ = RECORD.unpack_from(self.mem, slot * RECORD.size)
+        self.touch(slot)
+        return [transform_move(m, SYM_INV[s]) for m in moves[:n]]
+
+    def put(self, facecube, sol):
+        if len(facecube) != N_FACELETS or len(sol) > MAX_LEN:
+            return
+        key, s = self.canonical(facecube)
+        if key in self.index:
+            slot = self.index[key]
+            self.index.move_to_end(key)
+        else:
+            if self.free:
+                slot = self.free.pop()
+            else:
+                _, slot = self.index.popitem(last=False) # evict least recently used
+            self.index[key] = slot
+
+        RECORD.pack_into(
+            self.mem, slot * RECORD.size,
+            key.encode(), len(sol), bytes(transform_move(m, s) for m in sol), self.stamp
+        )
+        self.stamp += 1
+
+    def touch(self, slot):
+        struct.pack_into('<Q', self.mem, (slot + 1) * RECORD.size - 8, self.stamp)
+        self.stamp += 1
+
+    def close(self):
+        self.mem.flush()
+        self.mem.close()
+        self.file.close()
@@ -57,29 +57,33 @@ def cmd_waitdeg_wait(deg, waitport, tarvar, waitvar):
 def some_port(ports):
     return 1 << ((ports & -ports).bit_length() - 1)
 
-# Peform a single face move
-def rotate(brick, ports, deg, waitdeg):
+# Global memory needed by the move commands below
+ROTATE_MEM = 8
+ROTATE2_MEM = 12
+
+# Operations to peform a single face move
+def ops_rotate(ports, deg, waitdeg):
     waitport = some_port(ports)
     cmd = cmd_ready(ports)
     cmd += cmd_waitdeg_target(deg, waitport, waitdeg, 0)
     cmd += cmd_rotate(ports, deg)
     cmd += cmd_waitdeg_wait(deg, waitport, 0, 4)
-    brick.send_direct_cmd(cmd, global_mem=8)
+    return cmd
 
-# Perform an axial move where both sides are rotated by the same abs-degrees
-def rotate1(brick, ports1, ports2, deg1, deg2, waitdeg):
+# Operations to perform an axial move where both sides are rotated by the same abs-degrees
+def ops_rotate1(ports1, ports2, deg1, deg2, waitdeg):
     waitport = some_port(ports2)
     cmd = cmd_ready(ports1 + ports2)
     cmd += cmd_waitdeg_target(deg2, waitport, waitdeg, 0)
     cmd += cmd_rotate(ports1, deg1)
     cmd += cmd_rotate(ports2, deg2)
     cmd += cmd_waitdeg_wait(deg2, waitport, 0, 4)
-    brick.send_direct_cmd(cmd, global_mem=8)
+    return cmd
 
-# Perform an axial move where one side is half-turn and the other a quarter-turn.
+# Operations to perform an axial move where one side is half-turn and the other a quarter-turn.
 # In this case we want to start the latter turn a little later so that they both
 # end jointly and are thus aligned by the next move.
-def rotate2(brick, ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
+def ops_rotate2(ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
     waitport = some_port(ports1)
     cmd = cmd_ready(ports1 + ports2)
     cmd += cmd_waitdeg_target(deg1, waitport, waitdeg1, 0)
@@ -88,7 +92,20 @@ def rotate2(brick, ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
     cmd += cmd_waitdeg_wait(deg1, waitport, 0, 8)
     cmd += cmd_rotate(ports2, deg2)
     cmd += cmd_waitdeg_wait(deg1, waitport, 4, 8)
-    brick.send_direct_cmd(cmd, global_mem=12)
+    return cmd
+
+def rotate(brick, ports, deg, waitdeg):
+    brick.send_direct_cmd(ops_rotate(ports, deg, waitdeg), global_mem=ROTATE_MEM)
+
+def rotate1(brick, ports1, ports2, deg1, deg2, waitdeg):
+    brick.send_direct_cmd(
+        ops_rotate1(ports1, ports2, deg1, deg2, waitdeg), global_mem=ROTATE_MEM
+    )
+
+def rotate2(brick, ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
+    brick.send_direct_cmd(
+        ops_rotate2(ports1, ports2, deg1, deg2, waitdeg1, waitdeg2), global_mem=ROTATE2_MEM
+    )
 
 # Check if a button is pressed
 def is_pressed(brick, port):
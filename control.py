@@ -2,6 +2,10 @@
 
 from cmd import *
 from collections import namedtuple
+import os
+import pickle
+from queue import Queue
+from threading import Event, Thread
 import time
 import ev3
 
@@ -139,10 +143,150 @@ SPECIAL_AX_WAITDEG = int(5 * SAFETY)
 
 Motor = namedtuple('Motor', ['brick', 'ports'])
 
+MAX_CMD_LEN = 1024 # maximum size of a direct command the brick accepts
+
+
+# Sends compiled move commands with one sender thread per brick. A move is sent as soon as its corner
+# cutting precondition is met: if the previous move is on a different brick, once that has reached
+# its wait; otherwise immediately after it has been sent, since a brick queues direct commands and
+# executes them strictly in order anyway.
+# NOTE: With the current wiring every brick drives a single axis and `plan()` already merges
+# consecutive moves on the same axis, hence solver output never has two consecutive moves on the
+# same brick. There is then nothing to overlap and this is just the sequential loop of
+# `Robot.execute()` plus a thread hop per move; it only pays off once a brick drives several axes.
+class Dispatcher:
+
+    def __init__(self, bricks):
+        self.bricks = bricks
+        self.sends = [Queue() for _ in bricks]
+        self.dones = []
+        self.ticks = []
+        self.error = None
+        self.over = Event() # set once the current run is completed or has failed
+        self.gen = 0 # number of the current run, items of aborted earlier ones are dropped
+        for i in range(len(bricks)):
+            Thread(target=self.send, args=(i,), daemon=True).start()
+
+    def send(self, i):
+        while True:
+            gen, j, cmd, dep = self.sends[i].get()
+            if dep is not None:
+                dep.wait()
+            # Never touch the cube again once anything went wrong
+            if gen != self.gen or self.error is not None:
+                continue
+            try:
+                counter = self.bricks[i].send_cmd(cmd) # bricks are in ASYNC mode
+            except Exception as e:
+                self.fail(e)
+                continue
+            self.bricks[i].reply_future(counter).add_done_callback(
+                lambda reply, i=i, j=j, gen=gen: self.receive(i, j, gen, reply)
+            )
+
+    # Called directly by the reply reading thread of the brick
+    def receive(self, i, j, gen, reply):
+        if gen != self.gen:
+            return
+        try:
+            self.bricks[i].wait_for_reply(reply.result()[2:4]) # check for errors
+        except Exception as e:
+            self.fail(e)
+            return
+        self.ticks[j] = time.time()
+        self.dones[j].set()
+        if j == len(self.dones) - 1:
+            self.over.set()
+
+    # Releases all waiting moves, which are then dropped by the sending threads
+    def fail(self, e):
+        if self.error is None:
+            self.error = e
+        self.over.set()
+        for done in self.dones:
+            done.set()
+
+    # Run `(brick, cmd)`s as returned by `Robot.compile()`, returns the completion time of each;
+    # raises as soon as a command fails without sending any further ones
+    def run(self, cmds):
+        modes = [brick.sync_mode for brick in self.bricks]
+        for brick in self.bricks:
+            brick.sync_mode = ev3.ASYNC
+        self.gen += 1
+        self.dones = [Event() for _ in cmds]
+        self.ticks = [0.] * len(cmds)
+        self.error = None
+        self.over.clear()
+
+        prev = -1 # brick of the previous move
+        for j, (brick, cmd) in enumerate(cmds):
+            i = self.bricks.index(brick)
+            dep = self.dones[j - 1] if j > 0 and i != prev else None
+            self.sends[i].put((self.gen, j, cmd, dep))
+            prev = i
+        if cmds:
+            self.over.wait()
+
+        for brick, mode in zip(self.bricks, modes):
+            brick.sync_mode = mode
+        if self.error is not None:
+            raise self.error
+        return self.ticks
+
+
 # Somewhat of a relic from the prior version where we had differently geared motors
 DEGS = [0, -54, -108, 108, 54]
 COUNT = [-1, -2, 1, 2] # we have to invert directions from the perspective of the motors
 
+# All moves as passed to the command building of `Robot`, i.e. including both orders of axial
+# moves (except half + quarter-turn ones, which always start with the half-turn)
+MOVES = list(range(20)) + [
+    (m1, m2) for m1 in range(20) for m2 in range(20)
+    if are_parallel(m1, m2) and not (is_half(m2) and not is_half(m1))
+]
+# All possible waits, including the ones of final moves
+WAITDEGS = sorted(
+    set(w for ws in WAITDEG for w in ws) |
+    set(abs(DEGS[c]) - (27 - 1) for c in COUNT) |
+    set(max(DEGS[c1], DEGS[c2]) - (27 - 1) for c1 in COUNT for c2 in COUNT)
+)
+
+# Convert a solution as returned by the solver to the sequence of (potentially axial) moves
+# that is actually executed by the robot
+def plan(sol):
+    # Convert to numbering that includes inverse half-turns (i.e. 4 options per face)
+    sol = [(m // 3) * 4 + (m % 3) for m in sol]
+    sol1 = []
+    i = 0
+    while i < len(sol):
+        if i < len(sol) - 1 and are_parallel(sol[i], sol[i + 1]):
+            sol1.append((sol[i], sol[i + 1]))
+            i += 2
+        else:
+            sol1.append(sol[i])
+            i += 1
+    return optim_halfdirs(sol1)
+
+# Estimate how expensive a solution is to execute, i.e. the total number of motor degrees
+# we need to wait for between moves (the last move only has to get close enough to completion).
+# This is what actually matters for the robot, rather than the plain number of moves.
+def exec_cost(sol):
+    if len(sol) == 0:
+        return 0
+    sol1 = plan(sol)
+    cost = 0
+    for m1, m2 in zip(sol1[:-1], sol1[1:]):
+        cost += WAITDEG[cut(m1, m2)][int(is_half(m1))]
+    return cost + abs(DEGS[2 if is_half(sol1[-1]) else 1]) - (27 - 1)
+
+# Pick the fastest to execute of several candidate solutions (`None` for failed ones)
+def select_solution(sols, cost=exec_cost):
+    sols = [sol for sol in sols if sol is not None]
+    if len(sols) == 0:
+        return None
+    return min(sols, key=cost)
+
+
 class Robot:
 
     HOSTS = [
@@ -159,76 +303,158 @@ class Robot:
         Motor(1, ev3.PORT_C + ev3.PORT_D)
     ]
 
-    def __init__(self):
-        self.bricks = [
-            ev3.EV3(protocol='Usb', host=host) for host in Robot.HOSTS
-        ]
-
+    # `templates` is an optional file to load the precomputed move commands from (or store them to);
+    # with `parallel`, moves are sent by a `Dispatcher` instead of strictly one after the other;
+    # with `chain`, consecutive moves on the same brick are sent as a single command; an
+    # `ev3.WireTrace` passed as `trace` records all communication with the bricks; `devices` replace
+    # the USB connections to the actual bricks (f.i. by `sim.SimBrick`s); `waitdeg` is the table of
+    # corner cutting waits to use (like `WAITDEG`)
+    def __init__(
+        self, templates=None, parallel=False, chain=False, trace=None, devices=None, waitdeg=WAITDEG
+    ):
+        self.waitdeg = waitdeg
+        if devices is not None:
+            self.bricks = [ev3.EV3(protocol='Usb', device=device) for device in devices]
+        else:
+            self.bricks = [
+                ev3.EV3(protocol='Usb', host=host) for host in Robot.HOSTS
+            ]
+        if trace is not None:
+            for i, brick in enumerate(self.bricks):
+                brick.trace = trace.channel(i)
+        self.dispatcher = Dispatcher(self.bricks) if parallel else None
+        self.chain = chain
+
+        # Complete direct command (only the message counter needs to be replaced) for every possible
+        # (oriented) move and wait; there are only a few thousand of those
+        if templates is not None and os.path.exists(templates):
+            with open(templates, 'rb') as f:
+                self.templates = pickle.load(f)
+        else:
+            self.templates = {}
+            for m in MOVES:
+                for waitdeg in WAITDEGS:
+                    self.template(m, waitdeg)
+            if templates is not None:
+                with open(templates, 'wb') as f:
+                    pickle.dump(self.templates, f)
+
+    # Returns brick index and template command executing move `m`
     def move(self, m, prev, next):
-        motor = Robot.FACE_TO_MOTOR[m // 4]
         deg = DEGS[COUNT[m % 4]]
 
         if next is None:
             # NOTE: Cube can be considered solved once the final turn is < 45 degrees before completion
             waitdeg = abs(deg) - (27 - 1)
         else:
-            waitdeg = WAITDEG[cut(m, next)][int(is_half(m))]
+            waitdeg = self.waitdeg[cut(m, next)][int(is_half(m))]
 
-        rotate(self.bricks[motor.brick], motor.ports, deg, waitdeg)
+        return self.template(m, waitdeg)
 
     def move1(self, m, prev, next):
         m1, m2 = m
-        motor1, motor2 = Robot.FACE_TO_MOTOR[m1 // 4], Robot.FACE_TO_MOTOR[m2 // 4]
         count1, count2 = COUNT[m1 % 4], COUNT[m2 % 4]
         deg1, deg2 = DEGS[count1], DEGS[count2]
     
         if next is None:
            waitdeg = max(deg1, deg2) - (27 - 1)
         else:
-            waitdeg = WAITDEG[cut(m, next)][int(is_half(m))]
+            waitdeg = self.waitdeg[cut(m, next)][int(is_half(m))]
 
         # Half-turn + quarter-turn case
         if (abs(count1) == 2) != (abs(count2) == 2):
             if abs(count2) == 2:
                 return self.move1((m2, m1), prev, next)
-            rotate2(
-                self.bricks[motor1.brick], motor1.ports, motor2.ports, deg1, deg2,
-                SPECIAL_AX_WAITDEG, waitdeg
-            )
         else:
             # We always want to wait on the move with the worse in-cutting
-            if prev is not None and WAITDEG[cut(prev, m[0])] > WAITDEG[cut(prev, m[1])]:
+            if prev is not None and self.waitdeg[cut(prev, m[0])] > self.waitdeg[cut(prev, m[1])]:
                 return self.move1((m2, m1), prev, next)
-            rotate1(self.bricks[motor1.brick], motor1.ports, motor2.ports, deg1, deg2, waitdeg)
+        return self.template(m, waitdeg)
 
-    def execute(self, sol):
-        if len(sol) == 0:
-            return
+    def template(self, m, waitdeg):
+        key = (m, waitdeg)
+        if key not in self.templates:
+            brick, ops, mem = self.build(m, waitdeg)
+            self.templates[key] = (brick, self.bricks[brick].direct_cmd(ops, global_mem=mem))
+        return self.templates[key]
 
-        # Convert to numbering that includes inverse half-turns (i.e. 4 options per face)
-        sol = [(m // 3) * 4 + (m % 3) for m in sol]
-        sol1 = []
-        i = 0
-        while i < len(sol):
-            if i < len(sol) - 1 and are_parallel(sol[i], sol[i + 1]):
-                sol1.append((sol[i], sol[i + 1]))
-                i += 2
-            else:
-                sol1.append(sol[i])
-                i += 1
-        sol1 = optim_halfdirs(sol1)
-        print(len(sol1))
+    # Returns brick index, operations and global memory of the command for an already oriented move
+    def build(self, m, waitdeg):
+        if not is_axial(m):
+            motor = Robot.FACE_TO_MOTOR[m // 4]
+            return motor.brick, ops_rotate(motor.ports, DEGS[COUNT[m % 4]], waitdeg), ROTATE_MEM
 
+        m1, m2 = m
+        motor1, motor2 = Robot.FACE_TO_MOTOR[m1 // 4], Robot.FACE_TO_MOTOR[m2 // 4]
+        count1, count2 = COUNT[m1 % 4], COUNT[m2 % 4]
+        deg1, deg2 = DEGS[count1], DEGS[count2]
+        if (abs(count1) == 2) != (abs(count2) == 2):
+            return motor1.brick, ops_rotate2(
+                motor1.ports, motor2.ports, deg1, deg2, SPECIAL_AX_WAITDEG, waitdeg
+            ), ROTATE2_MEM
+        return motor1.brick, ops_rotate1(
+            motor1.ports, motor2.ports, deg1, deg2, waitdeg
+        ), ROTATE_MEM
+
+    # Turn a full solution into ready-to-send direct commands (already including headers), so that
+    # no command assembly is necessary anymore once execution has started. Also returns the number
+    # of moves performed by each command.
+    def compile(self, sol):
+        return self.compile_moves(plan(sol))
+
+    # Same as `compile()` but for moves as actually executed, i.e. as returned by `plan()`
+    def compile_moves(self, sol1):
+        groups = []
         for i in range(len(sol1)):
             prev = sol1[i - 1] if i > 0 else None
             next = sol1[i + 1] if i < len(sol1) - 1 else None
-            
-            tick = time.time()
             if is_axial(sol1[i]):
-                self.move1(sol1[i], prev, next)
+                brick, template = self.move1(sol1[i], prev, next)
             else:
-                self.move(sol1[i], prev, next)
-            print(time.time() - tick)            
+                brick, template = self.move(sol1[i], prev, next)
+            # The brick simply continues with the next move once the wait of the current one is
+            # over; thus only a switch to another brick needs a round-trip to the PC
+            if (
+                self.chain and groups and groups[-1][0] == brick and
+                sum(len(t) for t in groups[-1][1]) + len(template) <= MAX_CMD_LEN
+            ):
+                groups[-1][1].append(template)
+            else:
+                groups.append((brick, [template]))
+
+        cmds = []
+        for brick, templates in groups:
+            brick = self.bricks[brick]
+            if len(templates) == 1:
+                cmds.append((brick, brick.renew_cmd(templates[0])))
+            else:
+                cmds.append((brick, brick.chain_cmds(templates)))
+        return sol1, cmds, [len(templates) for _, templates in groups]
+
+    # Pass a list as `timings` to collect the duration of every executed move (chained moves can
+    # not be timed individually and are thus skipped)
+    def execute(self, sol, timings=None):
+        if len(sol) == 0:
+            return
+
+        sol1, cmds, counts = self.compile(sol)
+        print(len(sol1))
+
+        ticks = [time.time()]
+        if self.dispatcher is not None:
+            ticks += self.dispatcher.run(cmds)
+        else:
+            for brick, cmd in cmds:
+                brick.send_cmd(cmd)
+                ticks.append(time.time())
+
+        if timings is not None:
+            i = 0
+            for j, count in enumerate(counts):
+                if count == 1:
+                    next = sol1[i + 1] if i < len(sol1) - 1 else None
+                    timings.append((sol1[i], next, ticks[j + 1] - ticks[j]))
+                i += count
 
     def solve_pressed(self):
         return is_pressed(self.bricks[2], 3) # right button
@@ -0,0 +1,96 @@
+# Model of the actual execution time of solutions. Since every move command only returns once
+# its tacho-based wait is over, the duration of a move is determined by its corner cutting case
+# and can be measured directly; see `Robot.execute(..., timings)`.
+
+import os
+import pickle
+import sys
+
+from control import *
+
+N_CUTS = len(WAITDEG)
+FINAL = 2 * N_CUTS # the final move is not cut into any next one
+N_FEATURES = FINAL + 2
+
+# Rough guesses for cases without any measurements
+SECS_PER_DEG = .002
+SECS_PER_MOVE = .003 # mostly USB communication overhead
+
+# Timing case of a move (as executed by the robot) followed by `next`
+def feature(m, next):
+    if next is None:
+        return FINAL + int(is_half(m))
+    return 2 * cut(m, next) + int(is_half(m))
+
+def features(sol1):
+    return [feature(m, next) for m, next in zip(sol1, sol1[1:] + [None])]
+
+def default_coefs():
+    coefs = [0.] * N_FEATURES
+    for i in range(N_CUTS):
+        for j in [0, 1]:
+            coefs[2 * i + j] = SECS_PER_MOVE + SECS_PER_DEG * WAITDEG[i][j]
+    for j in [0, 1]:
+        coefs[FINAL + j] = SECS_PER_MOVE + SECS_PER_DEG * (abs(DEGS[j + 1]) - (27 - 1))
+    return coefs
+
+
+class CostModel:
+
+    def __init__(self, coefs=None):
+        self.coefs = coefs if coefs is not None else default_coefs()
+
+    # Predicted execution time in seconds of a solution as returned by the solver
+    def predict(self, sol):
+        if len(sol) == 0:
+            return 0.
+        return sum(self.coefs[f] for f in features(plan(sol)))
+
+    # Fit to `(move, next, secs)` timings as recorded by `Robot.execute()`; every case is simply
+    # assigned its mean duration, cases with fewer than `min_count` samples keep their estimates.
+    def fit(self, timings, min_count=5):
+        sums = [0.] * N_FEATURES
+        counts = [0] * N_FEATURES
+        for m, next, secs in timings:
+            f = feature(m, next)
+            sums[f] += secs
+            counts[f] += 1
+        for f in range(N_FEATURES):
+            if counts[f] >= min_count:
+                self.coefs[f] = sums[f] / counts[f]
+        return self
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self.coefs, f)
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return CostModel()
+        with open(path, 'rb') as f:
+            return CostModel(pickle.load(f))
+
+
+# Append the timings of a run to a log-file
+def log_timings(path, timings):
+    with open(path, 'ab') as f:
+        pickle.dump(timings, f)
+
+def load_timings(path):
+    timings = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                timings += pickle.load(f)
+            except EOFError:
+                return timings
+
+
+# Calibrate a model from logged runs: `python cost.py TIMINGS MODEL`
+if __name__ == '__main__':
+    model = CostModel().fit(load_timings(sys.argv[1]))
+    for i in range(N_CUTS):
+        print(i, '%.4f %.4f' % (model.coefs[2 * i], model.coefs[2 * i + 1]))
+    print('final', '%.4f %.4f' % (model.coefs[FINAL], model.coefs[FINAL + 1]))
+    model.save(sys.argv[2])
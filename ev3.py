@@ -21,16 +21,18 @@ LEGO EV3 direct commands
 
 # pylint: disable=invalid-name, too-many-lines, C0326
 
+import itertools
 import socket
 import struct
 import re
 import threading
+from concurrent.futures import Future
 import time
 import datetime
 import math
 import usb.core
 
-def LCX(value: int) -> bytes:
+def _encode_lcx(value: int) -> bytes:
     """create a LC0, LC1, LC2, LC4, dependent from the value"""
     if   value >=    -32 and value <      0:
         return struct.pack('b', 0x3F & (value + 64))
@@ -49,7 +51,7 @@ def LCS(value: str) -> bytes:
     """
     return b'\x84' + str.encode(value) + b'\x00'
 
-def LVX(value: int) -> bytes:
+def _encode_lvx(value: int) -> bytes:
     """
     create a LV0, LV1, LV2, LV4, dependent from the value
     """
@@ -64,7 +66,7 @@ def LVX(value: int) -> bytes:
     else:
         return b'\xc3' + struct.pack('<i', value)
 
-def GVX(value: int) -> bytes:
+def _encode_gvx(value: int) -> bytes:
     """create a GV0, GV1, GV2, GV4, dependent from the value"""
     if value   <     0:
         raise RuntimeError('No negative values allowed')
@@ -77,6 +79,40 @@ def GVX(value: int) -> bytes:
     else:
         return b'\xe3' + struct.pack('<i', value)
 
+def _encoding_table(encode, values: range) -> dict:
+    """
+    precompute the encodings of all values of a range
+    (values for which encode raises are left out)
+    """
+    table = {}
+    for value in values:
+        try:
+            table[value] = encode(value)
+        except (struct.error, RuntimeError):
+            pass
+    return table
+
+_LCX_TABLE = _encoding_table(_encode_lcx, range(-32768, 32768))
+_LVX_TABLE = _encoding_table(_encode_lvx, range(256))
+_GVX_TABLE = _encoding_table(_encode_gvx, range(256))
+
+def LCX(value: int) -> bytes:
+    """create a LC0, LC1, LC2, LC4, dependent from the value"""
+    encoded = _LCX_TABLE.get(value)
+    return encoded if encoded is not None else _encode_lcx(value)
+
+def LVX(value: int) -> bytes:
+    """
+    create a LV0, LV1, LV2, LV4, dependent from the value
+    """
+    encoded = _LVX_TABLE.get(value)
+    return encoded if encoded is not None else _encode_lvx(value)
+
+def GVX(value: int) -> bytes:
+    """create a GV0, GV1, GV2, GV4, dependent from the value"""
+    encoded = _GVX_TABLE.get(value)
+    return encoded if encoded is not None else _encode_gvx(value)
+
 # pylint: disable=too-many-instance-attributes
 # pylint: disable=too-few-public-methods
 class PID():
@@ -186,17 +222,231 @@ class SysCmdError(Exception):
     """
     pass
 
+def format_frame(frame: bytes) -> str:
+    """
+    format a frame like 0x|len|counter|type|...|, the remaining fields
+    depend on whether it is a direct or system command or reply
+    """
+    if frame[4:5] in [_DIRECT_COMMAND_REPLY, _DIRECT_COMMAND_NO_REPLY]:
+        bounds = [0, 2, 4, 5, 7]
+    elif frame[4:5] in [_SYSTEM_REPLY, _SYSTEM_REPLY_ERROR]:
+        bounds = [0, 2, 4, 5, 6, 7]
+    else:
+        bounds = [0, 2, 4, 5]
+    fields = [frame[i:j] for i, j in zip(bounds, bounds[1:])]
+    if len(frame) > bounds[-1]:
+        fields.append(frame[bounds[-1]:])
+    return '0x|' + ''.join(
+        ':'.join('{:02X}'.format(byte) for byte in field) + '|' for field in fields
+    )
+
+class PrintTrace:
+    """
+    trace which immediately prints every frame (as with verbosity)
+    """
+    def record(self, direction: int, frame: bytes) -> None:
+        """
+        print a frame together with the current time
+        """
+        now = datetime.datetime.now().strftime('%H:%M:%S.%f')
+        print(now + (' Sent ' if direction == TRACE_SENT else ' Recv ') + format_frame(frame))
+
+class WireTrace:
+    """
+    binary trace of the frames sent to and received from LEGO EV3s,
+    recorded with monotonic nanosecond timestamps into a preallocated ring buffer.
+    Recording only copies bytes, formatting is left to the dump tool (wiredump.py).
+    """
+    _ENTRY = struct.Struct('<QqBBH') # sequence number, timestamp, source, direction, frame length
+
+    def __init__(self, size: int=4096, frame_size: int=64):
+        """
+        Keyword Arguments:
+        size: number of frames kept (older ones are overwritten)
+        frame_size: number of bytes kept of every frame (longer ones are truncated)
+        """
+        self._size = size
+        self._frame_size = frame_size
+        self._slot = self._ENTRY.size + frame_size
+        self._buffer = bytearray(size * self._slot)
+        self._seqs = itertools.count(1)
+
+    def record(self, direction: int, frame: bytes, source: int=0) -> None:
+        """
+        store a frame, can be called from any thread
+        """
+        seq = next(self._seqs)
+        pos = (seq % self._size) * self._slot
+        self._ENTRY.pack_into(
+            self._buffer, pos, seq, time.monotonic_ns(), source, direction, len(frame)
+        )
+        data = frame[:self._frame_size]
+        pos += self._ENTRY.size
+        self._buffer[pos:pos + len(data)] = data
+
+    def entries(self) -> list:
+        """
+        Returns:
+        recorded frames as (sequence number, timestamp [ns], source, direction, frame length,
+        frame), in chronological order (frames may be truncated)
+        """
+        entries = []
+        for pos in range(0, len(self._buffer), self._slot):
+            seq, stamp, source, direction, len_frame = self._ENTRY.unpack_from(self._buffer, pos)
+            if seq > 0:
+                data = bytes(self._buffer[
+                    pos + self._ENTRY.size:pos + self._ENTRY.size + min(len_frame, self._frame_size)
+                ])
+                entries.append((seq, stamp, source, direction, len_frame, data))
+        entries.sort()
+        return entries
+
+    def channel(self, source: int):
+        """
+        sink recording into this trace with the given source (f.i. the index of a brick),
+        this allows to trace several LEGO EV3s at once
+        """
+        return _TraceChannel(self, source)
+
+    def clear(self) -> None:
+        """
+        drop all recorded frames
+        """
+        self._buffer[:] = bytes(len(self._buffer))
+
+    def save(self, path: str) -> None:
+        """
+        write the raw ring buffer to a file (see load)
+        """
+        with open(path, 'wb') as file:
+            file.write(struct.pack('<II', self._size, self._frame_size))
+            file.write(self._buffer)
+
+    @staticmethod
+    def load(path: str):
+        """
+        read a trace written by save
+        """
+        with open(path, 'rb') as file:
+            size, frame_size = struct.unpack('<II', file.read(8))
+            trace = WireTrace(size, frame_size)
+            trace._buffer[:] = file.read() # pylint: disable=protected-access
+        return trace
+
+class _TraceChannel:
+    """
+    sink which records into a WireTrace with a fixed source
+    """
+    def __init__(self, trace: WireTrace, source: int):
+        self._trace = trace
+        self._source = source
+
+    def record(self, direction: int, frame: bytes) -> None:
+        """
+        store a frame
+        """
+        self._trace.record(direction, frame, self._source)
+
+class _ReplyReader:
+    """
+    drains the replies of a connection on its own thread and resolves
+    the future of the respective message counter with them
+    (replies may thus arrive in any order and be waited for from any thread)
+    """
+    def __init__(self, protocol: str, sock, device):
+        self._protocol = protocol
+        self._socket = sock
+        self._device = device
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._thread = None
+        self._error = None
+        self._buffer = b''
+        self.trace = None
+
+    def future(self, counter: bytes) -> Future:
+        """
+        future of the reply with the given message counter
+        (the reply may also have arrived already)
+        """
+        with self._lock:
+            if counter not in self._futures:
+                self._futures[counter] = Future()
+                if self._error is not None:
+                    self._futures[counter].set_exception(self._error)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            return self._futures[counter]
+
+    def pop(self, counter: bytes) -> bytes:
+        """
+        wait for the reply with the given message counter and remove it
+        """
+        future = self.future(counter)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                if self._futures.get(counter) is future:
+                    del self._futures[counter]
+
+    def _read(self):
+        """
+        read the next replies from the connection
+        """
+        # pylint: disable=no-member
+        if self._protocol in [BLUETOOTH, WIFI]:
+            data = self._socket.recv(1024)
+            if not data:
+                raise RuntimeError('Connection to EV3 closed')
+            self._buffer += data
+        else:
+            # every usb packet holds exactly one reply (padded to its full size)
+            reply = bytes(self._device.read(_EP_IN, 1024, 0))
+            len_data = struct.unpack('<H', reply[:2])[0] + 2
+            self._buffer += reply[:len_data]
+        # pylint: enable=no-member
+        replies = []
+        while len(self._buffer) >= 2:
+            len_data = struct.unpack('<H', self._buffer[:2])[0] + 2
+            if len(self._buffer) < len_data:
+                break
+            replies.append(self._buffer[:len_data])
+            self._buffer = self._buffer[len_data:]
+        return replies
+
+    def _run(self):
+        while True:
+            try:
+                replies = self._read()
+            except Exception as e: # pylint: disable=broad-except
+                with self._lock:
+                    self._error = e
+                    for future in self._futures.values():
+                        if not future.done():
+                            future.set_exception(e)
+                return
+            for reply in replies:
+                if self.trace is not None:
+                    self.trace.record(TRACE_RECV, reply)
+                counter = reply[2:4]
+                with self._lock:
+                    future = self._futures.get(counter)
+                    # a counter may be reused after wrapping around
+                    if future is None or future.done():
+                        future = Future()
+                        self._futures[counter] = future
+                future.set_result(reply)
+
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-instance-attributes
 class EV3:
     """
     object to communicate with a LEGO EV3 using direct commands
     """
-    _msg_cnt = 41
-    _lock = threading.Lock()
-    _foreign = {}
 
-    def __init__(self, protocol: str=None, host: str=None, ev3_obj=None):
+    def __init__(self, protocol: str=None, host: str=None, ev3_obj=None, device=None):
         """
         Establish a connection to a LEGO EV3 device
 
@@ -204,6 +454,8 @@ class EV3:
         protocol: None, 'Bluetooth', 'Usb' or 'Wifi'
         host: None or mac-address of the LEGO EV3 (f.i. '00:16:53:42:2B:99')
         ev3_obj: None or an existing EV3 object (its connections will be used)
+        device: None or an already opened usb device to use with protocol 'Usb'
+                (or any object with the same read and write methods, f.i. a simulated brick)
         """
         assert ev3_obj or protocol, \
             'Either protocol or ev3_obj needs to be given'
@@ -214,6 +466,8 @@ class EV3:
             self._protocol = ev3_obj._protocol
             self._device = ev3_obj._device
             self._socket = ev3_obj._socket
+            self._replies = ev3_obj._replies
+            self._msg_cnts = ev3_obj._msg_cnts
             # pylint: enable=protected-access
         else:
             assert protocol in [BLUETOOTH, WIFI, USB], \
@@ -226,9 +480,15 @@ class EV3:
                 self._connect_bluetooth(host)
             elif protocol == WIFI:
                 self._connect_wifi(host)
+            elif device is not None:
+                self._device = device
             else:
                 self._connect_usb(host)
+            self._replies = _ReplyReader(self._protocol, self._socket, self._device)
+            # message counters are only required to be unique per connection
+            self._msg_cnts = itertools.count(42)
         self._verbosity = 0
+        self._trace = None
         self._sync_mode = STD
 
     def __del__(self):
@@ -270,6 +530,7 @@ class EV3:
     def verbosity(self) -> int:
         """
         level of verbosity (prints on stdout).
+        Any verbosity > 0 installs a trace which prints every frame.
         """
         return self._verbosity
     @verbosity.setter
@@ -279,6 +540,23 @@ class EV3:
         assert value >= 0 and value <= 2, \
             "allowed verbosity values are: 0, 1 or 2"
         self._verbosity = value
+        if value >= 1:
+            self.trace = PrintTrace()
+        elif isinstance(self._trace, PrintTrace):
+            self.trace = None
+
+    @property
+    def trace(self):
+        """
+        sink which records all frames sent to and received from the LEGO EV3
+        (an object with a method record(direction, frame), f.i. a WireTrace)
+        or None.
+        """
+        return self._trace
+    @trace.setter
+    def trace(self, value):
+        self._trace = value
+        self._replies.trace = value
 
     def _connect_bluetooth(self, host: str) -> int:
         """
@@ -387,33 +665,96 @@ class EV3:
           sync_mode is ASYNC: message counter
           sync_mode is SYNC: reply of the LEGO EV3
         """
+        return self.send_cmd(self.direct_cmd(ops, local_mem, global_mem))
+
+    def direct_cmd(self, ops: bytes,
+                   local_mem: int = 0,
+                   global_mem: int = 0) -> bytes:
+        """
+        Build a complete direct command (with its own message counter) without sending it,
+        this allows to prepare commands ahead of time
+
+        Arguments:
+        ops: holds netto data only (operations), see send_direct_cmd
+
+        Keyword Arguments:
+        local_mem: size of the local memory
+        global_mem: size of the global memory
+
+        Returns:
+          the command, ready to be sent by send_cmd
+        """
         if global_mem > 0  or self._sync_mode == SYNC:
             cmd_type = _DIRECT_COMMAND_REPLY
         else:
             cmd_type = _DIRECT_COMMAND_NO_REPLY
-        self._lock.acquire()
-        if self._msg_cnt < 65535:
-            self._msg_cnt += 1
+        return _DIRECT_HEADER.pack(
+            len(ops) + 5,
+            self._next_msg_cnt(),
+            cmd_type,
+            local_mem * 1024 + global_mem
+        ) + ops
+
+    def renew_cmd(self, cmd: bytes) -> bytes:
+        """
+        Give a prebuilt direct command (f.i. a template created by direct_cmd) a fresh
+        message counter, this is all that is needed to send it (again)
+
+        Arguments:
+        cmd: complete direct command
+
+        Returns:
+          the command with a new message counter, ready to be sent by send_cmd
+        """
+        return cmd[:2] + _COUNTER.pack(self._next_msg_cnt()) + cmd[4:]
+
+    def chain_cmds(self, cmds: list) -> bytes:
+        """
+        Join several prebuilt direct commands into a single one, which executes
+        all their operations in order and (if any of them does) replies once at the end.
+        The operations share their memory, i.e. they must not rely on
+        memory contents left over by preceding ones
+
+        Arguments:
+        cmds: complete direct commands
+
+        Returns:
+          the joined command with a new message counter, ready to be sent by send_cmd
+        """
+        ops = b''.join(cmd[7:] for cmd in cmds)
+        mems = [struct.unpack('<h', cmd[5:7])[0] for cmd in cmds]
+        local_mem = max(mem // 1024 for mem in mems)
+        global_mem = max(mem % 1024 for mem in mems)
+        if any(cmd[4:5] == _DIRECT_COMMAND_REPLY for cmd in cmds):
+            cmd_type = _DIRECT_COMMAND_REPLY
         else:
-            self._msg_cnt = 1
-        msg_cnt = self._msg_cnt
-        self._lock.release()
-        cmd = b''.join([
-            struct.pack('<hh', len(ops) + 5, msg_cnt),
+            cmd_type = _DIRECT_COMMAND_NO_REPLY
+        return _DIRECT_HEADER.pack(
+            len(ops) + 5,
+            self._next_msg_cnt(),
             cmd_type,
-            struct.pack('<h', local_mem * 1024 + global_mem),
-            ops
-        ])
-        if self._verbosity >= 1:
-            now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-            print(now + \
-                  ' Sent 0x|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[0:2]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[2:4]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[4:5]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[5:7]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[7:]) + '|' \
-            )
+            local_mem * 1024 + global_mem
+        ) + ops
+
+    def _next_msg_cnt(self) -> int:
+        """
+        get the message counter for the next command
+        (next() of itertools.count is atomic, hence no locking is needed)
+        """
+        return (next(self._msg_cnts) - 1) % 65535 + 1
+
+    def send_cmd(self, cmd: bytes) -> bytes:
+        """
+        Send a direct command built by direct_cmd to the LEGO EV3
+
+        Arguments:
+        cmd: complete direct command
+
+        Returns:
+          same as send_direct_cmd
+        """
+        if self._trace is not None:
+            self._trace.record(TRACE_SENT, cmd)
         if self._protocol in [BLUETOOTH, WIFI]:
             self._socket.send(cmd)
         elif self._protocol is USB:
@@ -439,54 +780,29 @@ class EV3:
         Returns:
         reply to the direct command
         """
-        self._lock.acquire()
-        reply = self._get_foreign_reply(counter)
-        if reply:
-            self._lock.release()
-            if reply[4:5] != _DIRECT_REPLY:
-                raise DirCmdError(
-                    "direct command {:02X}:{:02X} replied error".format(
-                        reply[2],
-                        reply[3]
-                    )
+        reply = self._replies.pop(counter)
+        if reply[4:5] != _DIRECT_REPLY:
+            raise DirCmdError(
+                "direct command {:02X}:{:02X} replied error".format(
+                    reply[2],
+                    reply[3]
                 )
-            return reply
-        while True:
-            # pylint: disable=no-member
-            if self._protocol in [BLUETOOTH, WIFI]:
-                reply = self._socket.recv(1024)
-            else:
-                reply = bytes(self._device.read(_EP_IN, 1024, 0))
-            # pylint: enable=no-member
-            len_data = struct.unpack('<H', reply[:2])[0] + 2
-            reply_counter = reply[2:4]
-            if self._verbosity >= 1:
-                now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-                print(now + \
-                      ' Recv 0x|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[0:2]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[2:4]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[4:5]) + \
-                      '|', end='')
-                if len_data > 5:
-                    dat = ':'.join('{:02X}'.format(byte) for byte in reply[5:len_data])
-                    print(dat + '|')
-                else:
-                    print()
-            if counter != reply_counter:
-                self._put_foreign_reply(reply_counter, reply[:len_data])
-            else:
-                self._lock.release()
-                if reply[4:5] != _DIRECT_REPLY:
-                    raise DirCmdError(
-                        "direct command {:02X}:{:02X} replied error".format(
-                            reply[2],
-                            reply[3]
-                        )
-                    )
-                return reply[:len_data]
+            )
+        return reply
+
+    def reply_future(self, counter: bytes) -> Future:
+        """
+        Future of the (raw) reply to a command sent in ASYNC mode, this allows to
+        react to its arrival without blocking a thread
+
+        Arguments:
+        counter: is the message counter of the corresponding send_direct_cmd
+
+        Returns:
+        future that is resolved with the reply as soon as it is received
+        (unlike wait_for_reply, it is not checked for errors)
+        """
+        return self._replies.future(counter)
 
     def send_system_cmd(self, cmd: bytes, reply: bool=True) -> bytes:
         """
@@ -508,27 +824,9 @@ class EV3:
             cmd_type = _SYSTEM_COMMAND_REPLY
         else:
             cmd_type = _SYSTEM_COMMAND_NO_REPLY
-        self._lock.acquire()
-        if self._msg_cnt < 65535:
-            self._msg_cnt += 1
-        else:
-            self._msg_cnt = 1
-        msg_cnt = self._msg_cnt
-        self._lock.release()
-        cmd = b''.join([
-            struct.pack('<hh', len(cmd) + 3, msg_cnt),
-            cmd_type,
-            cmd
-        ])
-        if self._verbosity >= 1:
-            now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-            print(now + \
-                  ' Sent 0x|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[0:2]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[2:4]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[4:5]) + '|' + \
-                  ':'.join('{:02X}'.format(byte) for byte in cmd[5:]) + '|' \
-            )
+        cmd = _SYSTEM_HEADER.pack(len(cmd) + 3, self._next_msg_cnt(), cmd_type) + cmd
+        if self._trace is not None:
+            self._trace.record(TRACE_SENT, cmd)
         # pylint: disable=no-member
         if self._protocol in [BLUETOOTH, WIFI]:
             self._socket.send(cmd)
@@ -554,71 +852,10 @@ class EV3:
         Returns:
         reply to the system command
         """
-        self._lock.acquire()
-        reply = self._get_foreign_reply(counter)
-        if reply:
-            self._lock.release()
-            if reply[4:5] != _SYSTEM_REPLY:
-                raise SysCmdError("error: {:02X}".format(reply[6]))
-            return reply
-        if self._protocol == BLUETOOTH:
-            time.sleep(0.1)
-        while True:
-            # pylint: disable=no-member
-            if self._protocol in [BLUETOOTH, WIFI]:
-                reply = self._socket.recv(1024)
-            else:
-                reply = bytes(self._device.read(_EP_IN, 1024, 0))
-            # pylint: enable=no-member
-            len_data = struct.unpack('<H', reply[:2])[0] + 2
-            reply_counter = reply[2:4]
-            if self._verbosity >= 1:
-                now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-                print(now + \
-                      ' Recv 0x|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[0:2]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[2:4]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[4:5]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[5:6]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[6:7]) + \
-                      '|', end='')
-                if len_data > 7:
-                    dat = ':'.join('{:02X}'.format(byte) for byte in reply[7:len_data])
-                    print(dat + '|')
-                else:
-                    print()
-            if counter != reply_counter:
-                self._put_foreign_reply(reply_counter, reply[:len_data])
-            else:
-                self._lock.release()
-                if reply[4:5] != _SYSTEM_REPLY:
-                    raise SysCmdError("system command replied error: {:02X}".format(reply[6]))
-                return reply[:len_data]
-
-    def _put_foreign_reply(self, counter: bytes, reply: bytes) -> None:
-        """
-        put a foreign reply to the stack
-        """
-        if counter in self._foreign:
-            raise ValueError('reply with counter ' + counter + ' already exists')
-        else:
-            self._foreign[counter] = reply
-
-    def _get_foreign_reply(self, counter: bytes) -> bytes:
-        """
-        get a reply from the stack (returns None if there is no)
-        and delete this reply from the stack
-        """
-        if counter in self._foreign:
-            reply = self._foreign[counter]
-            del self._foreign[counter]
-            return reply
-        else:
-            return None
+        reply = self._replies.pop(counter)
+        if reply[4:5] != _SYSTEM_REPLY:
+            raise SysCmdError("system command replied error: {:02X}".format(reply[6]))
+        return reply
 # pylint: enable=too-many-instance-attributes
 
 WIFI      = 'Wifi'
@@ -647,6 +884,13 @@ _SYSTEM_COMMAND_NO_REPLY = b'\x81'
 _SYSTEM_REPLY = b'\x03'
 _SYSTEM_REPLY_ERROR = b'\x05'
 
+TRACE_SENT = 0                        # directions of traced frames
+TRACE_RECV = 1
+
+_DIRECT_HEADER = struct.Struct('<HH1sH') # length, counter, type, memory sizes
+_SYSTEM_HEADER = struct.Struct('<HH1s')  # length, counter, type
+_COUNTER = struct.Struct('<H')
+
 # return codes of system commands
 SYSTEM_REPLY_OK = b'\x00'
 SYSTEM_UNKNOWN_HANDLE = b'\x01'
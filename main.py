@@ -6,11 +6,13 @@ import pickle
 import subprocess
 import threading
 import time
-from threading import Thread
 
 import numpy as np
 
+from cache import *
+import ev3
 from control import *
+from cost import *
 from scan import *
 from solve import *
 
@@ -21,16 +23,32 @@ config = config['DEFAULT']
 with Solver() as solver:
     print('Solver initialized.')
 
-    robot = Robot()
+    # Recording all frames is cheap enough to always keep it on; see `wiredump.py`
+    wire = ev3.WireTrace() if 'wiretrace' in config else None
+    robot = Robot(
+        parallel=config.getboolean('parallel', fallback=False),
+        chain=config.getboolean('chain', fallback=False),
+        trace=wire
+    )
+    model = CostModel.load(config['cost'])
+    cache = SolutionCache(config['cache'])
     print('Connected to robot.')
 
     points = np.array(pickle.load(open(config['pos'], 'rb')))
-    extractor = ColorExtractor(points, int(config['scan_size']))
+    # Decoding at reduced resolution is the biggest lever on the fixed cost of scanning
+    scale = config.getint('scale', fallback=1)
+    extractor = ColorExtractor(points, int(config['scan_size']), scale)
     matcher = ColorMatcher()
-    cam = IpCam(config['cam'])
+    trace = AssignTrace()
+    if config.getboolean('stream', fallback=False):
+        cam = IpCamStream(config['cam'], scale)
+        cam.start()
+    else:
+        cam = IpCam(config['cam'], scale)
+    flasher = FlashController(cam)
     print('Scanning set up.')
 
-    flash = False
+    flash = None # future of the last switch-on of the torch
 
     print('Ready.') # we don't want to print this again and again while waiting for button presses
     while True: # polling is the most straight-forward way to check both buttons at once
@@ -40,18 +58,18 @@ with Solver() as solver:
             start = time.time()
             robot.execute(scramble)
             print('Scrambled! %fs' % (time.time() - start))
-            cam.flash(False)
-            flash = False
+            flasher.switch(False)
+            flash = None
             continue
         elif not robot.solve_pressed():
             continue
         else:
-            if not flash:
-                cam.flash(True)
-                flash = True
+            if flash is None:
+                flash = flasher.switch(True)
                 continue
         # Now actually start solving
 
+        flash.result() # make sure the torch is really on
         frame = cam.frame()
         # NOTE: We start timing only after we have received a frame from the camera and start any processing.
         # While this might not be 100% conform to the Guiness World Record rules, I am (at least at this point)
@@ -60,24 +78,34 @@ with Solver() as solver:
         start = time.time()
         print('Scanning ...')
         scans = extractor.extract_bgrs(frame)
-        facecube = matcher.match(scans)
+        facecube = matcher.match(scans, trace=trace)
         print('Solving ...')
-        sol = solver.solve(facecube)
+        sol = cache.get(facecube)
+        if sol is None: # known positions skip the solver entirely
+            if config.getboolean('candidates', fallback=False):
+                sols = solver.solve_candidates(facecube)
+            else:
+                sols = [solver.solve_async(facecube)]
+        # Switching off the torch only needs a tiny bit of I/O on the controller's worker thread,
+        # hence we can already do it while the solver is busy
+        flasher.switch(False)
+        flash = None
+        if sol is None:
+            sol = select_solution([sol.result() for sol in sols], model.predict)
         print(time.time() - start)
 
         if sol is not None:
-            # Turn off flash only after processor is not busy with solving anymore
-            flash_off = Thread(target=lambda: cam.flash(False)) 
-            flash_off.start()
-
             print('Executing ...')
-            robot.execute(sol)
+            timings = []
+            robot.execute(sol, timings)
             print('Solved! %fs' % (time.time() - start))
-            
-            flash_off.join()
-            flash = False
+            log_timings(config['timings'], timings) # for calibrating the cost model
+            cache.put(facecube, sol)
+            if wire is not None:
+                wire.save(config['wiretrace'])
         else:
             print('Error.')
+            trace.dump() # only print the assignment details once they are actually needed
             
         print('Ready.')
 
@@ -0,0 +1,268 @@
+# Physics-based simulation of the robot's face moves for studying corner cutting. The exact same
+# commands as on the robot are executed by simulated bricks (see `sim.py`), only in virtual time, so
+# that thousands of move sequences or new `WAITDEG` values can be evaluated in a few seconds.
+
+import math
+import random
+import sys
+
+from control import *
+from sim import *
+
+# Rough guesses for an EV3 medium motor turning a face; to be calibrated against real timings
+ACCEL = 60000. # degrees per second^2
+DECEL = 80000. # when braking at the end of a step
+DELAY = .001 # until a motor actually starts moving after a step command
+
+FACE_PER_MOTOR = 90 / abs(DEGS[COUNT[0]]) # face degrees per motor degree
+PLAY = 3 # motor degrees a face can turn before it actually pushes against its neighbours
+
+# Maximum misalignment in face degrees of the previous face (indexed like `WAITDEG`) at which the
+# next face can still turn. Unlike the waits, this depends only on the cube and not on the motors.
+# `None` entries fall back to what the hand-tuned `WAITDEG` allows under the default physics (see
+# `waitdeg_angles()`); the current values are exactly those and should be replaced by measurements.
+COLLISION_ANGLES = [
+    [28, 44], # CUT
+    [34, 54], # ANTICUT
+    [24, 28], # AX_CUT1
+    [24, 18], # AX_CUT2
+    [28, 34], # AX_PARTCUT1
+    [28, 28], # AX_PARTCUT2
+    [31, 41], # AX_ANTICUT1
+    [31, 41], # AX_ANTICUT2
+    [21, 24], # AXAX_CUT
+    [28, 28], # AXAX_PARTCUT
+    [24, 38]  # AXAX_ANTICUT
+]
+
+
+# Movement of a motor during a single step: trapezoidal speed profile starting from standstill
+class Profile:
+
+    def __init__(self, t, pos, power, deg, max_speed, accel, decel, delay):
+        self.start = t + delay
+        self.pos = pos
+        self.target = pos + (deg if power > 0 else -deg)
+        self.dir = 1 if power > 0 else -1
+        self.dist = deg
+        self.accel = accel
+        self.decel = decel
+
+        speed = max_speed * abs(power) / 100
+        if speed == 0:
+            self.dist = 0
+        # Distance is too short to reach full speed
+        if speed ** 2 * (1 / accel + 1 / decel) / 2 > self.dist:
+            speed = math.sqrt(2 * self.dist * accel * decel / (accel + decel))
+        self.speed = speed
+        self.tacc = speed / accel if speed > 0 else 0
+        self.tdec = speed / decel if speed > 0 else 0
+        self.dacc = speed * self.tacc / 2
+        self.ddec = speed * self.tdec / 2
+        self.tcruise = (self.dist - self.dacc - self.ddec) / speed if speed > 0 else 0
+        self.end = self.start + self.tacc + self.tcruise + self.tdec
+
+    # Distance covered after `dt` seconds
+    def covered(self, dt):
+        if dt <= 0:
+            return 0.
+        if dt < self.tacc:
+            return self.accel * dt ** 2 / 2
+        dt -= self.tacc
+        if dt < self.tcruise:
+            return self.dacc + self.speed * dt
+        dt -= self.tcruise
+        if dt < self.tdec:
+            return self.dacc + self.speed * self.tcruise + self.speed * dt - self.decel * dt ** 2 / 2
+        return self.dist
+
+    def tacho(self, t):
+        return self.pos + self.dir * self.covered(t - self.start)
+
+    # First time at which the motor has moved by `dist` degrees (`None` if it never does)
+    def time_at(self, dist):
+        if dist > self.dist:
+            return None
+        lo, hi = self.start, self.end
+        for _ in range(50):
+            mid = (lo + hi) / 2
+            if self.covered(mid - self.start) < dist:
+                lo = mid
+            else:
+                hi = mid
+        return hi
+
+
+# Motor with limited acceleration, which keeps all its steps for later analysis
+class PhysicsMotor:
+
+    def __init__(self, max_speed=MAX_SPEED, accel=ACCEL, decel=DECEL, delay=DELAY):
+        self.max_speed = max_speed
+        self.accel = accel
+        self.decel = decel
+        self.delay = delay
+        self.steps = []
+
+    # All move commands wait for `opOutput_Ready` first, i.e. steps always start from standstill
+    def step(self, t, power, deg):
+        self.steps.append(Profile(
+            t, self.tacho(t), power, deg, self.max_speed, self.accel, self.decel, self.delay
+        ))
+
+    def tacho(self, t):
+        for step in reversed(self.steps):
+            if t >= step.start - self.delay:
+                return step.tacho(t)
+        return 0.
+
+    def ready(self):
+        return self.steps[-1].end if self.steps else 0.
+
+
+# Sequential execution of moves (as done by `Robot.execute()`) in virtual time
+class MotionSim:
+
+    # `angles` are the collision angles like `COLLISION_ANGLES`
+    def __init__(
+        self, waitdeg=WAITDEG, motor=PhysicsMotor, latency=LATENCY, angles=COLLISION_ANGLES
+    ):
+        self.motor = motor
+        self.latency = latency
+        self.clock = VirtualClock()
+        self.bricks = [SimEV3(motor, self.clock) for _ in Robot.HOSTS]
+        self.robot = Robot(devices=self.bricks, waitdeg=waitdeg)
+        if any(a is None for row in angles for a in row):
+            fallback = waitdeg_angles()
+            angles = [
+                [fallback[case][half] if a is None else a for half, a in enumerate(row)]
+                for case, row in enumerate(angles)
+            ]
+        self.angles = angles
+
+    def reset(self):
+        self.clock.t = 0.
+        for brick in self.bricks:
+            brick.motors = [self.motor() for _ in brick.motors]
+
+    # (One of the) motor(s) driving face `f`
+    def face_motor(self, f):
+        motor = Robot.FACE_TO_MOTOR[f]
+        return self.bricks[motor.brick].motors[some_port(motor.ports).bit_length() - 1]
+
+    # Execute moves as returned by `plan()`, returns the total time and all collisions as
+    # `(index of the move, cut case, misalignment of the previous face, allowed misalignment)`
+    def run(self, sol1):
+        self.reset()
+        _, cmds, _ = self.robot.compile_moves(sol1)
+        for brick, cmd in cmds:
+            self.clock.sleep(self.latency / 2)
+            reply = self.bricks[self.robot.bricks.index(brick)].run_cmd(cmd)
+            self.clock.sleep(self.latency / 2)
+            if reply[4:5] != ev3._DIRECT_REPLY:
+                raise SimError('command failed')
+        return self.clock.now(), self.collisions(sol1)
+
+    def run_solution(self, sol):
+        return self.run(plan(sol))
+
+    # Misalignment of the previous face (in face degrees) once the next one starts to push
+    def misalignment(self, prev, next):
+        start = min(
+            motor.steps[k].time_at(PLAY) for motor, k in next if k < len(motor.steps)
+        )
+        return FACE_PER_MOTOR * max(
+            abs(motor.steps[k].target - motor.steps[k].tacho(start)) for motor, k in prev
+        )
+
+    # `(motor, index of its step)` for every face of every move of the last run
+    def steps(self, sol1):
+        counts = {}
+        steps = []
+        for m in sol1:
+            steps.append([])
+            for f in move_faces(m):
+                steps[-1].append((self.face_motor(f), counts.get(f, 0)))
+                counts[f] = counts.get(f, 0) + 1
+        return steps
+
+    def collisions(self, sol1):
+        steps = self.steps(sol1)
+        collisions = []
+        for i in range(len(sol1) - 1):
+            case = cut(sol1[i], sol1[i + 1])
+            allowed = self.angles[case][int(is_half(sol1[i]))]
+            angle = self.misalignment(steps[i], steps[i + 1])
+            if angle > allowed + 1e-6:
+                collisions.append((i + 1, case, angle, allowed))
+        return collisions
+
+    # Smallest wait for every cut case (and quarter-/half-turn) such that no collisions occur
+    def tune(self):
+        default = self.robot.waitdeg
+        waitdeg = [[0, 0] for _ in range(N_CUT_CASES)]
+        for case in range(N_CUT_CASES):
+            for half in [0, 1]:
+                pairs = example_pairs(case, half)
+                # Waiting longer never causes collisions, hence we can simply binary search
+                lo, hi = 0, abs(DEGS[COUNT[1 if half else 0]])
+                while lo < hi:
+                    w = (lo + hi) // 2
+                    self.robot.waitdeg = [[w, w] for _ in range(N_CUT_CASES)]
+                    if any(self.run(list(pair))[1] for pair in pairs):
+                        lo = w + 1
+                    else:
+                        hi = w
+                waitdeg[case][half] = lo
+        self.robot.waitdeg = default
+        return waitdeg
+
+
+N_CUT_CASES = len(WAITDEG)
+
+def move_faces(m):
+    return [m[0] // 4, m[1] // 4] if is_axial(m) else [m // 4]
+
+N_EXAMPLES = 16
+
+# A fixed sample of executed moves followed by another one, such that they form the given cut case
+def example_pairs(case, half, n=N_EXAMPLES):
+    pairs = [
+        (m1, m2) for m1 in MOVES for m2 in MOVES if (
+            not set(move_faces(m1)) & set(move_faces(m2)) and
+            cut(m1, m2) == case and int(is_half(m1)) == half
+        )
+    ]
+    return random.Random(0).sample(pairs, min(n, len(pairs)))
+
+_waitdeg_angles = None
+
+# Misalignment that the hand-tuned `WAITDEG` values allow for in every cut case under the default
+# physics; computed only once as this takes about a second
+def waitdeg_angles():
+    global _waitdeg_angles
+    if _waitdeg_angles is None:
+        msim = MotionSim(angles=[[float('inf')] * 2 for _ in range(N_CUT_CASES)])
+        angles = [[0., 0.] for _ in range(N_CUT_CASES)]
+        for case in range(N_CUT_CASES):
+            for half in [0, 1]:
+                for pair in example_pairs(case, half):
+                    msim.run(list(pair))
+                    angle = msim.misalignment(*msim.steps(list(pair)))
+                    angles[case][half] = max(angles[case][half], angle)
+        _waitdeg_angles = angles
+    return _waitdeg_angles
+
+
+# Simulate random sequences and tune waits: `python motion.py [N_SEQS]`
+if __name__ == '__main__':
+    msim = MotionSim()
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    total = 0.
+    collisions = 0
+    for _ in range(n):
+        sol = [random.randrange(15) for _ in range(20)]
+        secs, cols = msim.run_solution(sol)
+        total += secs
+        collisions += len(cols)
+    print('%.3fs per 20 moves, %d collisions' % (total / n, collisions))
+    print('tuned waits:', msim.tune())
@@ -1,7 +1,12 @@
-from collections import namedtuple
-import copy
-from heapq import *
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import pickle
+import re
+import socket
+import sys
+import threading
 import time
+import urllib.parse
 import urllib.request
 
 import numpy as np
@@ -80,34 +85,106 @@ for c in list(CORNER_TWISTS):
     CORNER_TWISTS.add((c[2], c[0], c[1]))
 
 CENTERS = [4, 13, 22, 31, 40, 49]
+IS_CENTER = np.isin(np.arange(N_FACELETS), CENTERS)
 
 
-# `remove()` that does not throw if the element does not exis
-def remove(l, e):
-    try:
-        l.remove(e)
-    except:
-        pass
+# Sets of colors are represented as 6-bit masks
+COL_MASK = (1 << N_COLORS) - 1
+
+# Every color can appear on an edge or corner with all but itself and its opposite color
+PARTNER_MASKS = [COL_MASK & ~(1 << c) & ~(1 << ((c + 3) % N_COLORS)) for c in range(N_COLORS)]
+
+# Index of a (partially) assigned corner into `TWIST_MASKS`; every position is encoded as `col + 1`
+def twist_index(cols):
+    return sum((c + 1) * 7 ** i for i, c in enumerate(cols))
+
+# Precompute the colors completing a corner with 2 assigned positions to a valid twist
+TWIST_MASKS = [0] * 7 ** 3
+for c in CORNER_TWISTS:
+    for i in range(3):
+        tmp = list(c)
+        tmp[i] = NO_COL
+        TWIST_MASKS[twist_index(tmp)] |= 1 << c[i]
+
+
+# Events recorded in an `AssignTrace`
+ASSIGN = 0
+ELIM = 1
+
+EVENT_NAMES = ['assign', 'elim']
+
+# Fixed-size in-memory ring buffer of color assignment events. This replaces printing every
+# single assignment, which is way too slow for the timed scan, while still allowing to inspect
+# what happened when a scan fails.
+class AssignTrace:
+
+    def __init__(self, size=512):
+        self.events = [None] * size
+        self.count = 0
+
+    def clear(self):
+        self.count = 0
+
+    def add(self, event, facelet, col):
+        self.events[self.count % len(self.events)] = (event, facelet, col)
+        self.count += 1
+
+    # Recorded events in chronological order (only the most recent ones if the buffer overflowed)
+    def entries(self):
+        if self.count <= len(self.events):
+            return self.events[:self.count]
+        i = self.count % len(self.events)
+        return self.events[i:] + self.events[:i]
+
+    def dump(self, file=sys.stdout):
+        if self.count > len(self.events):
+            print('(%d older events dropped)' % (self.count - len(self.events)), file=file)
+        for event, facelet, col in self.entries():
+            print(EVENT_NAMES[event], facelet, COLORS[col], file=file)
+
+    # Store the events for offline analysis
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self.entries(), f)
+
+
+# Every pair of non-opposite colors appears on exactly 2 corners
+CPART_COUNT = [
+    2 * ((PARTNER_MASKS[c1] >> c2) & 1) for c1 in range(N_COLORS) for c2 in range(N_COLORS)
+]
 
 
 class CubeBuilder:
 
-    def __init__(self):
+    def __init__(self, trace=None):
         self.colors = [NO_COL] * N_FACELETS
-        self.ecols = [[NO_COL] * 2 for _ in range(N_EDGES)]
-        self.ccols = [[NO_COL] * 3 for _ in range(N_CORNERS)]       
- 
-        self.eavail = [U, R, F, D, L, B] * 4
-        self.eavail_part = [
-            [R, L, F, B],
-            [B, F, U, D],
-            [U, D, R, L],
-            [R, L, F, B],
-            [U, D, F, B],
-            [U, D, R, L]
-        ]
-        self.cavail = copy.deepcopy(self.eavail)
-        self.cavail_part = [avail * 2 for avail in self.eavail_part]       
+        self.ecols = [NO_COL] * (2 * N_EDGES) # edge `e` occupies positions `2 * e` and `2 * e + 1`
+        self.ccols = [NO_COL] * (3 * N_CORNERS)
+        self.ctwist = [0] * N_CORNERS # current `twist_index()` of every corner
+        self.ecount = [0] * N_COLORS
+        self.epart = [0] * N_COLORS
+        self.ccount = [0] * N_COLORS
+        self.cpart_count = [0] * (N_COLORS * N_COLORS)
+        self.cpart = [0] * N_COLORS
+        self.reset(trace)
+
+    # Reinitialize in-place so that a single builder can be reused for many scans
+    def reset(self, trace=None):
+        self.trace = trace
+        self.colors[:] = [NO_COL] * N_FACELETS
+        self.ecols[:] = [NO_COL] * (2 * N_EDGES)
+        self.ccols[:] = [NO_COL] * (3 * N_CORNERS)
+        self.ctwist[:] = [0] * N_CORNERS
+
+        # Every color appears on exactly 4 edge and 4 corner facelets
+        self.ecount[:] = [4] * N_COLORS
+        self.eavail = COL_MASK
+        self.epart[:] = PARTNER_MASKS
+
+        self.ccount[:] = [4] * N_COLORS
+        self.cavail = COL_MASK
+        self.cpart_count[:] = CPART_COUNT
+        self.cpart[:] = PARTNER_MASKS
 
     def assign(self, facelet, col):
         if self.colors[facelet] != NO_COL:
@@ -115,69 +192,80 @@ class CubeBuilder:
 
         cubie = FACELET_TO_CUBIE[facelet]
         if (facelet % 9) % 2 == 1: # is on an edge
-            if col not in self.edge_cols(cubie):
-                print('elim', facelet, COLORS[col]) # NOTE: for debugging
+            if not (self.edge_cols(cubie) >> col) & 1:
+                if self.trace is not None:
+                    self.trace.add(ELIM, facelet, col)
                 return False
             self.assign_edge(facelet, col)
         elif cubie != -1: # don't go here for centers
-            if col not in self.corner_cols(cubie):
-                print('elim', facelet, COLORS[col]) # NOTE: for debugging
+            if not (self.corner_cols(cubie) >> col) & 1:
+                if self.trace is not None:
+                    self.trace.add(ELIM, facelet, col)
                 return False
             self.assign_corner(facelet, col)
 
-        print('assign', facelet, COLORS[col]) # NOTE: for debugging
+        if self.trace is not None:
+            self.trace.add(ASSIGN, facelet, col)
         self.colors[facelet] = col
         return True
 
     def assign_edge(self, facelet, col):
-        edge = FACELET_TO_CUBIE[facelet]
-        self.ecols[edge][FACELET_TO_POS[facelet]] = col
-
-        remove(self.eavail, col)
-        if len([c for c in self.ecols[edge] if c != NO_COL]) == 2: # edge fully assigned
-            c1, c2 = self.ecols[edge]
-            remove(self.eavail_part[c1], c2)
-            remove(self.eavail_part[c2], c1)
+        i = 2 * FACELET_TO_CUBIE[facelet] + FACELET_TO_POS[facelet]
+        self.ecols[i] = col
+
+        if self.ecount[col] > 0:
+            self.ecount[col] -= 1
+            if self.ecount[col] == 0:
+                self.eavail &= ~(1 << col)
+        other = self.ecols[i ^ 1]
+        if other != NO_COL: # edge fully assigned
+            self.epart[col] &= ~(1 << other)
+            self.epart[other] &= ~(1 << col)
 
     def assign_corner(self, facelet, col):
         corner = FACELET_TO_CUBIE[facelet]
-        self.ccols[corner][FACELET_TO_POS[facelet]] = col
-
-        remove(self.cavail, col)
-        for c in self.ccols[corner]: # when we have more than 1 color of a corner
+        pos = FACELET_TO_POS[facelet]
+        self.ccols[3 * corner + pos] = col
+        self.ctwist[corner] += (col + 1) * 7 ** pos
+
+        if self.ccount[col] > 0:
+            self.ccount[col] -= 1
+            if self.ccount[col] == 0:
+                self.cavail &= ~(1 << col)
+        for i in range(3 * corner, 3 * corner + 3): # when we have more than 1 color of a corner
+            c = self.ccols[i]
             if c != NO_COL and c != col:
-                remove(self.cavail_part[col], c)
-                remove(self.cavail_part[c], col)
+                self.unpair_corner(col, c)
+                self.unpair_corner(c, col)
+
+    def unpair_corner(self, col1, col2):
+        i = N_COLORS * col1 + col2
+        if self.cpart_count[i] > 0:
+            self.cpart_count[i] -= 1
+            if self.cpart_count[i] == 0:
+                self.cpart[col1] &= ~(1 << col2)
 
     def edge_cols(self, edge):
         # If an edge already has one color simply return its available partners
-        if self.ecols[edge][0] != NO_COL:
-            return self.eavail_part[self.ecols[edge][0]]
-        if self.ecols[edge][1] != NO_COL:
-            return self.eavail_part[self.ecols[edge][1]]
+        if self.ecols[2 * edge] != NO_COL:
+            return self.epart[self.ecols[2 * edge]]
+        if self.ecols[2 * edge + 1] != NO_COL:
+            return self.epart[self.ecols[2 * edge + 1]]
         return self.eavail
 
     def corner_cols(self, corner):
-        avail = set([c for c in range(N_COLORS)])
+        avail = COL_MASK
         count = 0
-        i_missing = -1
-        for i, c in enumerate(self.ccols[corner]):
+        for i in range(3 * corner, 3 * corner + 3):
+            c = self.ccols[i]
             if c != NO_COL:
-                avail &= set(self.cavail_part[c])
+                avail &= self.cpart[c]
                 count += 1
-            elif i_missing < 0:
-                i_missing = i
 
         if count == 1:
             return avail
         if count == 2: # use corner twists to limit the valid colors even more
-            avail1 = []
-            for c in avail:
-                tmp = copy.copy(self.ccols[corner])
-                tmp[i_missing] = c
-                if tuple(tmp) in CORNER_TWISTS:
-                    avail1.append(c)
-            return avail1
+            return avail & TWIST_MASKS[self.ctwist[corner]]
 
         return self.cavail
 
@@ -200,21 +288,81 @@ def transform(hsv):
         hsv[1] * np.cos(2 * np.pi * tmp), hsv[1] * np.sin(2 * np.pi * tmp), hsv[2]
     ])
 
-def distances(points1, points2):
+# Same as `transform()` but for a full N x 3 array of HSV values at once
+def transform_all(hsvs):
+    i = np.clip(np.searchsorted(HUES, hsvs[:, 0], side='right'), 1, 5)
+    tmp = .2 * ((i - 1) + (hsvs[:, 0] - HUES[i - 1]) / (HUES[i] - HUES[i - 1]))
+    return np.stack([
+        hsvs[:, 1] * np.cos(2 * np.pi * tmp), hsvs[:, 1] * np.sin(2 * np.pi * tmp), hsvs[:, 2]
+    ], axis=1)
+
+# The hue part of the transformation precomputed for every possible 8-bit OpenCV hue
+HUE_LUT = transform_all(np.stack([np.arange(256) / 180, np.ones(256), np.zeros(256)], axis=1))[:, :2]
+
+# Transform OpenCV's raw 8-bit HSV values using the lookup-table
+def transform_lut(hsvs):
+    sats = hsvs[:, 1] / 255
+    return np.stack([
+        sats * HUE_LUT[hsvs[:, 0], 0], sats * HUE_LUT[hsvs[:, 0], 1], hsvs[:, 2] / 255
+    ], axis=1)
+
+def distances(points1, points2, out=None):
     # Much faster than any manual calculations
-    return scipy.spatial.distance.cdist(points1, points2, metric='euclidean')    
-
-def kmeans(points, centers):
-    while True:
+    return scipy.spatial.distance.cdist(points1, points2, metric='euclidean', out=out)
+
+# Upper bound on the number of clustering iterations to limit the worst-case scanning time
+KMEANS_ITERS = 25
+# Stop as soon as no center moves by more than this
+KMEANS_EPS = 1e-6
+
+# `max_iters=None` and `eps=0` yields the exact (but unbounded) k-means iteration
+def kmeans(points, centers, max_iters=KMEANS_ITERS, eps=KMEANS_EPS):
+    centers = centers.copy()
+    i = 0
+    while max_iters is None or i < max_iters:
         assigned = np.argmin(distances(points, centers), axis=1)
-        converged = True
-        for i in range(centers.shape[0]):
-            tmp = np.mean(points[assigned == i], axis=0)
-            if (tmp != centers[i]).any():
-                centers[i] = tmp
-                converged = False
-        if converged:
-            return centers
+        counts = np.bincount(assigned, minlength=centers.shape[0])
+        sums = np.stack([
+            np.bincount(assigned, weights=points[:, j], minlength=centers.shape[0])
+            for j in range(points.shape[1])
+        ], axis=1)
+
+        nonempty = counts > 0 # empty clusters simply keep their previous center
+        updated = centers.copy()
+        updated[nonempty] = sums[nonempty] / counts[nonempty].reshape(-1, 1)
+        shift = np.max(np.abs(updated - centers))
+        centers = updated
+        if shift <= eps:
+            break
+        i += 1
+    return centers
+
+# Same as `kmeans()` but for a whole K x N x D stack of independent point sets at once
+def kmeans_many(points, centers, max_iters=KMEANS_ITERS, eps=KMEANS_EPS):
+    k = centers.shape[1]
+    centers = centers.copy()
+    active = np.arange(centers.shape[0]) # sets that have not converged yet
+    i = 0
+    while active.size > 0 and (max_iters is None or i < max_iters):
+        pts = points[active]
+        cur = centers[active]
+        n = active.size * k
+        dists = np.linalg.norm(pts[:, :, None, :] - cur[:, None, :, :], axis=3)
+        # Give every set its own range of labels to do all updates with a single `np.bincount()`
+        assigned = (np.argmin(dists, axis=2) + (np.arange(active.size) * k).reshape(-1, 1)).ravel()
+        counts = np.bincount(assigned, minlength=n).reshape(-1, k)
+        sums = np.stack([
+            np.bincount(assigned, weights=pts[:, :, j].ravel(), minlength=n)
+            for j in range(pts.shape[2])
+        ], axis=1).reshape(active.size, k, -1)
+
+        nonempty = counts > 0
+        updated = cur.copy()
+        updated[nonempty] = sums[nonempty] / counts[nonempty].reshape(-1, 1)
+        centers[active] = updated
+        active = active[np.max(np.abs(updated - cur), axis=(1, 2)) > eps]
+        i += 1
+    return centers
 
 # Debugging plot
 def plot_colors(bgrs, transformed, centers):
@@ -243,92 +391,333 @@ def plot_colors(bgrs, transformed, centers):
 
     plt.show()
 
-Assignment = namedtuple('Assignment', ['conf', 'facelet', 'col', 'rank'])
-
-
 class ColorMatcher:
 
-    def match(self, bgrs, fixed_centers=True, debug=False):
+    def __init__(self, lut=True, warm_start=False):
+        self.lut = lut
+        # Start clustering from the centers of the last match (instead of the center facelets),
+        # which typically converges in fewer iterations when the lighting stays the same
+        self.warm_start = warm_start
+        self.centers = None
+
+        # Scratch state reused between calls to avoid any allocations that are not necessary
+        self.cube = CubeBuilder()
+        self.distm = np.zeros((N_FACELETS, N_COLORS))
+        self.gaps = np.zeros((N_FACELETS, N_COLORS)) # last column always stays 0
+        self.conf = np.zeros(N_FACELETS)
+        self.rank = np.zeros(N_FACELETS, dtype=int)
+
+    # Map BGR colors (N x 3) to the transformed HSV space
+    def transform(self, bgrs):
         hsvs = cv2.cvtColor(np.expand_dims(bgrs, 0), cv2.COLOR_BGR2HSV)[0]
-        hsvs = hsvs.astype(np.float)
+        if self.lut:
+            return transform_lut(hsvs)
+        hsvs = hsvs.astype(float)
         hsvs[:, 0] /= 180
         hsvs[:, 1:] /= 255
-        transformed = np.apply_along_axis(transform, 1, hsvs)
-       
-        centers = kmeans(transformed, transformed[CENTERS])
+        return transform_all(hsvs)
+
+    # Pass an `AssignTrace` to record all assignment decisions of this call
+    def match(self, bgrs, fixed_centers=True, debug=False, trace=None):
+        transformed = self.transform(bgrs)
+        if self.warm_start and self.centers is not None:
+            centers = kmeans(transformed, self.centers)
+        else:
+            centers = kmeans(transformed, transformed[CENTERS])
+        self.centers = centers
         if debug:
             plot_colors(bgrs, transformed, centers)
 
-        cube = CubeBuilder()
-        distm = distances(transformed, centers)
+        return self.assign(distances(transformed, centers, out=self.distm), fixed_centers, trace)
+
+    # Match a whole stack of scans (K x 54 x 3) at once, mostly intended for offline evaluation.
+    # Everything up to the final constraint assignment is done in a single vectorized pass.
+    def match_many(self, bgrs, fixed_centers=True):
+        transformed = self.transform(bgrs.reshape(-1, 3)).reshape(bgrs.shape)
+        centers = kmeans_many(transformed, transformed[:, CENTERS])
+        distms = np.linalg.norm(transformed[:, :, None, :] - centers[:, None, :, :], axis=3)
+        return [self.assign(distm, fixed_centers) for distm in distms]
+
+    # Assign colors to facelets given their distances to all color centers (54 x 6)
+    def assign(self, distm, fixed_centers=True, trace=None):
+        if trace is not None:
+            trace.clear()
+        cube = self.cube
+        cube.reset(trace)
+
         order = np.argsort(distm, axis=1)
-        # Duplicate last column to avoid boundary checks
-        order = np.concatenate((order, order[:, -1].reshape(-1, 1)), axis=1)
+        # Confidence of assigning the color of every rank, i.e. distance difference to the next best
+        # color; 0 for the last one
+        dists = np.take_along_axis(distm, order, axis=1)
+        np.subtract(dists[:, :-1], dists[:, 1:], out=self.gaps[:, :-1])
+
+        # Current confidence and rank of every facelet; this replaces a heap of pending
+        # assignments as there is always exactly one per unassigned facelet (`np.argmin()` also
+        # resolves ties by the lowest facelet index, just like the heap would)
+        conf = self.conf
+        rank = self.rank
+        conf[:] = self.gaps[:, 0]
+        rank[:] = 0
 
         assigned = 0
         if fixed_centers:
             for c, f in enumerate(CENTERS):
                 cube.assign(f, c)
+            conf[IS_CENTER] = np.inf
             assigned += 6
 
-        heap = []
-        for f in range(N_FACELETS):
-            if fixed_centers and f in CENTERS:
-                continue
-            heap.append(Assignment(
-                distm[f, order[f, 0]] - distm[f, order[f, 1]],
-                f, order[f][0], 0
-            ))
-        heapify(heap)
-
         while assigned < N_FACELETS:
-            ass = heappop(heap)
-            if not cube.assign(ass.facelet, ass.col):
-                f = ass.facelet
-                i = ass.rank
+            f = int(np.argmin(conf))
+            i = rank[f]
+            if not cube.assign(f, int(order[f, i])):
                 if i == N_COLORS - 1:
                     return ''
-                heappush(heap, Assignment(
-                    distm[f, order[f, i + 1]] - distm[f, order[f, i + 2]],
-                    f, order[f][i + 1], i + 1 
-                ))
+                rank[f] = i + 1
+                conf[f] = self.gaps[f, i + 1]
             else:
+                conf[f] = np.inf
                 assigned += 1
         return cube.facecube()
 
 
 class ColorExtractor:
 
-    def __init__(self, points, size):
+    # `scale` is the factor by which frames are downscaled relative to the one the scan points were
+    # selected on (see `IpCam`)
+    def __init__(self, points, size, scale=1):
         self.points = points
         self.size = size
+        self.scale = scale
+
+        # Precompute the pixel coordinates of all scan patches so that a frame can be processed
+        # with a single gather instead of looping over every individual scan point
+        d = max(size // scale // 2, 1)
+        flat = np.array([p for ps in points for p in ps]) // scale
+        dy, dx = np.mgrid[-d:d, -d:d]
+        self.xs = flat[:, 0].reshape(-1, 1) + dx.reshape(1, -1)
+        self.ys = flat[:, 1].reshape(-1, 1) + dy.reshape(1, -1)
+
+        # Faces may have a different number of scan points (which are stored consecutively)
+        self.counts = np.array([len(ps) for ps in points])
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+
+        # Flat gather index, depends on the image width and is thus only built with the first frame
+        self.shape = None
+        self.index = None
 
     def extract_bgrs(self, image):
-        d = self.size // 2
-        scans = np.zeros((self.points.shape[0], 3))
+        if image.shape[:2] != self.shape:
+            self.shape = image.shape[:2]
+            self.index = (self.ys * self.shape[1] + self.xs).ravel()
 
-        for i in range(self.points.shape[0]):
-            for x, y in self.points[i]:
-                tmp = image[(y - d):(y + d), (x - d):(x + d)]
-                scans[i] += np.mean(tmp, axis=(0, 1))
-            scans[i] /= len(self.points[i]) # average over all scan points for face
+        pixels = image.reshape(-1, image.shape[2])[self.index]
+        means = np.mean(pixels.reshape(self.xs.shape[0], -1, image.shape[2]), axis=1)
+        scans = np.add.reduceat(means, self.starts, axis=0)
+        scans /= self.counts.reshape(-1, 1) # average over all scan points for face
 
         return scans.astype(np.uint8)
 
 
+# `cv2.imdecode()` flags per downscaling factor; JPEGs can be decoded directly at a reduced
+# resolution, which is considerably faster than full decoding
+DECODE_FLAGS = {
+    1: -1, # choose encoding automatically -> default: BGR
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
 # Very simple interface to fetch an image from the "IPWebCam" app
 class IpCam:
 
-    def __init__(self, url):
+    def __init__(self, url, scale=1):
         self.url = url
+        self.scale = scale
+        self.switched = 0. # time of the last torch switch
 
-    def frame(self):
+    # Every shot is fetched freshly, hence it is trivially newer than `after`
+    def frame(self, after=None):
         frame = urllib.request.urlopen(self.url + '/shot.jpg')
         frame = np.array(bytearray(frame.read()), dtype=np.uint8)
-        frame = cv2.imdecode(frame, -1) # choose encoding automatically -> default: BGR
+        frame = cv2.imdecode(frame, DECODE_FLAGS[self.scale])
         return frame
 
     def flash(self, on):
         urllib.request.urlopen(self.url + ('/enabletorch' if on else '/disabletorch'))
         time.sleep(.5)
+        self.switched = time.time()
+
+
+# End of the headers of a part of the multipart stream, the JPEG data follows right after it
+PART_HEADERS_END = b'\r\n\r\n'
+CONTENT_LENGTH = re.compile(rb'content-length:\s*(\d+)', re.IGNORECASE)
+
+# Streaming version of `IpCam` that continuously consumes the app's MJPEG stream over a single
+# persistent connection on a background thread, always keeping only the most recent decoded
+# frame. This takes connection setup and decoding off the critical path.
+class IpCamStream(IpCam):
+
+    def __init__(self, url, scale=1, chunk=1 << 14, timeout=5.):
+        super().__init__(url, scale)
+        self.chunk = chunk
+        self.timeout = timeout
+        self.latest = None
+        self.stamp = 0. # time at which `latest` was received
+        self.cond = threading.Condition()
+        self.stream = None
+        self.sock = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def start(self):
+        url = urllib.parse.urlsplit(self.url)
+        conn = http.client.HTTPConnection(url.netloc, timeout=self.timeout)
+        conn.request('GET', url.path + '/video')
+        sock = conn.sock # the connection itself forgets it once the response is read
+        stream = conn.getresponse()
+        if stream.status != 200:
+            stream.close()
+            raise RuntimeError('Camera stream not available')
+        self.sock = sock
+        self.stream = stream
+        self.thread = threading.Thread(target=self.grab, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None: # never started
+            return
+        stream = self.stream
+        self.stream = None
+        # Only closing does not wake up a grabber thread blocked in reading
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError: # stream has already ended
+            pass
+        stream.close()
+        self.thread.join()
+        self.thread = None
+
+    def grab(self):
+        try:
+            buf = b''
+            while self.stream is not None:
+                try:
+                    data = self.stream.read1(self.chunk)
+                except Exception:
+                    break
+                if not data: # stream was closed
+                    break
+                buf += data
+
+                # Skip all but the last complete JPEG in the buffer; parts are split by their
+                # `Content-Length` as JPEG markers may also appear inside of f.i. EXIF thumbnails
+                jpeg = None
+                while True:
+                    end = buf.find(PART_HEADERS_END)
+                    if end < 0:
+                        break
+                    length = CONTENT_LENGTH.search(buf[:end])
+                    if length is None: # there is no way to find the end of this part
+                        raise RuntimeError('Camera stream part without Content-Length')
+                    start = end + len(PART_HEADERS_END)
+                    end = start + int(length[1])
+                    if len(buf) < end:
+                        break
+                    jpeg = buf[start:end]
+                    buf = buf[end:]
+                if jpeg is None:
+                    continue
+
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), DECODE_FLAGS[self.scale])
+                if frame is None: # corrupted frame
+                    continue
+                with self.cond:
+                    self.latest = frame
+                    self.stamp = time.time()
+                    self.cond.notify_all()
+        finally:
+            with self.cond: # wake up any waiting `frame()` calls
+                self.cond.notify_all()
+
+    # Most recent frame which was received after time `after`, by default the last torch switch
+    # (waits if necessary)
+    def frame(self, after=None):
+        thread = self.thread
+        if thread is None:
+            raise RuntimeError('Camera stream not started')
+        if after is None:
+            after = self.switched
+        with self.cond:
+            if not self.cond.wait_for(
+                lambda: self.stamp > after or not thread.is_alive(), self.timeout
+            ) or self.stamp <= after:
+                raise RuntimeError('No frame received from camera stream')
+            return self.latest
+
+
+# Average brightness of a (subsampled) frame
+def brightness(frame):
+    return np.mean(frame[::8, ::8])
+
+# Minimum relative increase in brightness after which we consider the torch to be on
+FLASH_GAIN = 1.15
+# If no brightness change is seen in this time, we assume that the torch is on anyway
+FLASH_TIMEOUT = .5
+
+# Switches the torch of an `IpCam` (or `IpCamStream`) on a dedicated worker thread over a persistent
+# connection. Instead of sleeping for a fixed time, switching on is confirmed by watching the
+# brightness of incoming frames.
+class FlashController:
+
+    def __init__(self, cam, timeout=5.):
+        self.cam = cam
+        url = urllib.parse.urlsplit(cam.url)
+        self.conn = http.client.HTTPConnection(url.netloc, timeout=timeout)
+        self.path = url.path
+        self.worker = ThreadPoolExecutor(max_workers=1) # also serializes all switches
+        self.on = None # unknown, the torch might f.i. still be on from a crashed run
+
+    # Returns a future that completes once the switch is done; its result is `False` only if
+    # switching on could not be confirmed from the frames (in which case `FLASH_TIMEOUT` has passed)
+    def switch(self, on):
+        return self.worker.submit(self.run, on)
+
+    def run(self, on):
+        if on == self.on:
+            return True
+        ref = brightness(self.cam.frame(time.time())) if on else 0.
+        self.request('/enabletorch' if on else '/disabletorch')
+        self.on = on
+        tick = time.time()
+        self.cam.switched = tick
+        if not on:
+            return True
 
+        # Any frame newer than the confirming one is lit as well, so `cam.switched` can stay as is
+        while time.time() - tick < FLASH_TIMEOUT:
+            if brightness(self.cam.frame(time.time())) > FLASH_GAIN * ref:
+                return True
+        self.cam.switched = time.time()
+        return False
+
+    def request(self, path):
+        for retry in [False, True]:
+            try:
+                self.conn.request('GET', self.path + path)
+                self.conn.getresponse().read() # we need to read everything to reuse the connection
+                return
+            except (http.client.HTTPException, OSError):
+                self.conn.close() # reconnects automatically with the next request
+                if retry:
+                    raise
+
+    def close(self):
+        self.worker.shutdown()
+        self.conn.close()
@@ -101,8 +101,11 @@ def show_matched():
     tick = time.time()    
     colors = extractor.extract_bgrs(image_og)
     matcher = ColorMatcher()
-    facecube = matcher.match(colors, debug=DEBUG)
+    trace = AssignTrace()
+    facecube = matcher.match(colors, debug=DEBUG, trace=trace)
     print(time.time() - tick)
+    if DEBUG:
+        trace.dump()
 
     if facecube == '':
         facecube = 'E' * 54
@@ -0,0 +1,246 @@
+# Simulated EV3 brick, which allows running (and timing) the robot control without any hardware.
+# It behaves like the USB device of a real brick and executes the direct commands sent to it,
+# implementing exactly the operations used in `cmd.py`.
+
+from queue import Empty, Queue
+import struct
+from threading import Thread
+import time
+
+import ev3
+
+MAX_SPEED = 1200. # degrees per second at full power (roughly an EV3 medium motor)
+POLL = .0005 # how long a busy waiting loop on the brick sleeps per iteration
+PACKET_SIZE = 1024 # USB replies are always padded to this size
+LATENCY = .002 # rough guess for the round-trip time of the USB connection
+
+
+class RealClock:
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, secs):
+        if secs > 0:
+            time.sleep(secs)
+
+
+# Simulated time, which passes only by sleeping; this way simulations run as fast as possible
+class VirtualClock:
+
+    def __init__(self):
+        self.t = 0.
+
+    def now(self):
+        return self.t
+
+    def sleep(self, secs):
+        if secs > 0:
+            self.t += secs
+
+
+# Motor turning at constant speed, i.e. with unlimited acceleration
+class SimMotor:
+
+    def __init__(self, max_speed=MAX_SPEED):
+        self.max_speed = max_speed
+        self.pos = 0. # tacho count once the current step is done
+        self.start = 0.
+        self.start_pos = 0.
+        self.end = 0.
+
+    def step(self, t, power, deg):
+        self.start_pos = self.tacho(t)
+        self.start = t
+        self.end = t + deg / (self.max_speed * abs(power) / 100) if power != 0 else t
+        self.pos = self.start_pos + (deg if power > 0 else -deg)
+
+    def tacho(self, t):
+        if t >= self.end:
+            return self.pos
+        return self.start_pos + (self.pos - self.start_pos) * (t - self.start) / (self.end - self.start)
+
+    # Time at which the current step is done
+    def ready(self):
+        return self.end
+
+
+class SimError(Exception):
+    pass
+
+
+# Reads the operands of a single command
+class Params:
+
+    def __init__(self, ops, pc, mem):
+        self.ops = ops
+        self.pc = pc
+        self.mem = mem
+
+    # Returns `(kind, value)` with kind 'c' for constants and 'g'/'l' for global/local variables
+    def next(self):
+        b = self.ops[self.pc]
+        self.pc += 1
+        if b & 0x80 == 0: # short format, everything packed into one byte
+            if b & 0x40 == 0:
+                return 'c', (b & 0x3F) - 64 if b & 0x20 else b & 0x3F
+            return 'g' if b & 0x20 else 'l', b & 0x1F
+        if b & 0x07 not in [1, 2, 3]: # strings or value-follows formats
+            raise SimError('unsupported parameter 0x%02X' % b)
+        n = [1, 2, 4][(b & 0x07) - 1]
+        value = int.from_bytes(self.ops[self.pc:self.pc + n], 'little', signed=b & 0x40 == 0)
+        self.pc += n
+        if b & 0x40 == 0:
+            return 'c', value
+        return 'g' if b & 0x20 else 'l', value
+
+    def int32(self):
+        kind, value = self.next()
+        if kind == 'c':
+            return value
+        return struct.unpack_from('<i', self.mem[kind], value)[0]
+
+    # Operand that is only written to
+    def var(self):
+        kind, value = self.next()
+        if kind == 'c':
+            raise SimError('constant as output parameter')
+        return self.mem[kind], value
+
+
+# Executes direct commands like a brick, but synchronously and in the time of `clock`
+class SimEV3:
+
+    def __init__(self, motor=SimMotor, clock=None):
+        self.clock = clock if clock is not None else RealClock()
+        self.motors = [motor() for _ in range(4)] # ports A - D
+        self.sensors = [0] * 4 # values read by `opInput_Read`, f.i. pressed touch sensors
+        self.executed = 0
+
+    def press(self, port, value=1):
+        self.sensors[port] = value
+
+    # Execute a complete command, returns the reply frame (`None` if no reply was requested)
+    def run_cmd(self, cmd):
+        cmd_type = cmd[4:5]
+        if cmd_type in [ev3._SYSTEM_COMMAND_REPLY, ev3._SYSTEM_COMMAND_NO_REPLY]:
+            if cmd_type == ev3._SYSTEM_COMMAND_REPLY:
+                return self.reply(cmd, ev3._SYSTEM_REPLY_ERROR + cmd[5:6] + b'\x01') # UNKNOWN_HANDLE
+            return None
+
+        mem = struct.unpack('<H', cmd[5:7])[0]
+        mem = {'g': bytearray(mem % 1024), 'l': bytearray(mem // 1024)}
+        try:
+            self.execute(cmd[7:], mem)
+            status = ev3._DIRECT_REPLY
+        except (SimError, IndexError, struct.error):
+            status = ev3._DIRECT_REPLY_ERROR
+        self.executed += 1
+        if cmd_type == ev3._DIRECT_COMMAND_REPLY:
+            return self.reply(cmd, status + bytes(mem['g']))
+        return None
+
+    def reply(self, cmd, data):
+        return struct.pack('<H', len(data) + 2) + cmd[2:4] + data
+
+    def ports(self, nos):
+        return [self.motors[i] for i in range(4) if nos & (1 << i)]
+
+    def execute(self, ops, mem):
+        pc = 0
+        while pc < len(ops):
+            op = ops[pc:pc + 1]
+            params = Params(ops, pc + 1, mem)
+
+            if op == ev3.opNop:
+                pass
+            elif op == ev3.opOutput_Ready:
+                params.int32() # layer
+                ready = max([m.ready() for m in self.ports(params.int32())], default=0)
+                self.clock.sleep(ready - self.clock.now())
+            elif op == ev3.opOutput_Step_Power:
+                params.int32() # layer
+                motors = self.ports(params.int32())
+                power = params.int32()
+                steps = [params.int32() for _ in range(3)]
+                params.int32() # brake
+                t = self.clock.now()
+                for m in motors:
+                    m.step(t, power, sum(steps))
+            elif op == ev3.opInput_Device:
+                if params.ops[params.pc:params.pc + 1] != ev3.GET_RAW:
+                    raise SimError('unsupported opInput_Device subcommand')
+                params.pc += 1
+                params.int32() # layer
+                no = params.int32()
+                if no < 16 or no > 19:
+                    raise SimError('no motor at port %d' % no)
+                buf, i = params.var()
+                struct.pack_into('<i', buf, i, round(self.motors[no - 16].tacho(self.clock.now())))
+            elif op == ev3.opInput_Read:
+                params.int32() # layer
+                no = params.int32()
+                params.int32() # type
+                params.int32() # mode
+                buf, i = params.var()
+                struct.pack_into('<b', buf, i, self.sensors[no])
+            elif op == ev3.opAdd32:
+                a, b = params.int32(), params.int32()
+                buf, i = params.var()
+                struct.pack_into('<i', buf, i, a + b)
+            elif op in [ev3.opJr_Lt32, ev3.opJr_Gt32]:
+                a, b = params.int32(), params.int32()
+                offset = params.int32()
+                if (a < b) if op == ev3.opJr_Lt32 else (a > b):
+                    params.pc += offset
+                    if offset < 0:
+                        self.clock.sleep(POLL) # busy waiting
+            else:
+                raise SimError('unsupported operation 0x%02X' % op[0])
+
+            pc = params.pc
+
+
+# Behaves like the pyusb device of a brick, i.e. `ev3.EV3(device=SimBrick())` gives a simulated
+# connection. Commands are executed one after the other on a separate thread, just like on the brick.
+class SimBrick(SimEV3):
+
+    def __init__(self, motor=SimMotor, latency=LATENCY):
+        super().__init__(motor)
+        self.latency = latency
+        self.cmds = Queue()
+        self.replies = Queue()
+        Thread(target=self.run, daemon=True).start()
+
+    def write(self, endpoint, data, timeout=None):
+        self.cmds.put((time.monotonic() + self.latency / 2, bytes(data)))
+        return len(data)
+
+    def read(self, endpoint, size, timeout=None):
+        try:
+            arrival, reply = self.replies.get(timeout=timeout / 1000 if timeout else None)
+        except Empty:
+            raise TimeoutError('no reply from simulated brick')
+        time.sleep(max(arrival - time.monotonic(), 0))
+        return reply + bytes(PACKET_SIZE - len(reply))
+
+    def run(self):
+        while True:
+            arrival, cmd = self.cmds.get()
+            time.sleep(max(arrival - time.monotonic(), 0))
+            reply = self.run_cmd(cmd)
+            if reply is not None:
+                self.replies.put((time.monotonic() + self.latency / 2, reply))
+
+
+# Time a random move sequence on a completely simulated robot: `python sim.py [N_MOVES]`
+if __name__ == '__main__':
+    import random
+    import sys
+    from control import *
+
+    robot = Robot(devices=[SimBrick() for _ in Robot.HOSTS])
+    sol = [random.randrange(15) for _ in range(int(sys.argv[1]) if len(sys.argv) > 1 else 20)]
+    tick = time.time()
+    robot.execute(sol)
+    print('%d moves: %.3fs' % (len(sol), time.time() - tick))
@@ -1,11 +1,19 @@
 # This file handles computing actual solutions by interfacing with the C++ solver.
 
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from queue import Queue
 from subprocess import Popen, PIPE
+from threading import Lock, Thread
 import time
 
 N_THREADS = 12
 SOLVE_TIME = 25
 SCRAMBLE_TIME = 50 # we don't care too much about speed when scrambling
+# Time limits of the queries for collecting several candidate solutions for the same facecube; a
+# single solver process handles them one after the other, hence they share one `SOLVE_TIME` budget.
+# A quick first query followed by one with the remaining time makes it likely that the two
+# solutions actually differ (while the second one is not much worse than a full `SOLVE_TIME` one).
+CANDIDATE_TIMES = [SOLVE_TIME // 5, SOLVE_TIME - SOLVE_TIME // 5]
 
 # The robot's move order, actually different from the solver's
 NAME_TO_MOVE = {m: i for i, m in enumerate([
@@ -83,36 +91,153 @@ def convert_sol(sol):
 
     return [NAME_TO_MOVE[m] for m in splits1] # finally convert names to move IDs
 
-# Simple Python interface to the interactive mode of the "twophase" solver
+# Simple Python interface to the interactive mode of the "twophase" solver. Requests can also be
+# submitted asynchronously, a reader thread then resolves the corresponding futures in order as
+# the solver's replies come in.
 class Solver:
 
+    def __init__(self, n_threads=N_THREADS, solve_time=SOLVE_TIME, binary='./twophase'):
+        self.n_threads = n_threads
+        self.solve_time = solve_time
+        self.binary = binary
+
     def __enter__(self):
         self.proc = Popen(
-            ['./twophase', '-t', str(N_THREADS), 'interactive'], stdin=PIPE, stdout=PIPE
+            [self.binary, '-t', str(self.n_threads), 'interactive'], stdin=PIPE, stdout=PIPE
         )
-        while 'Ready!' not in self.proc.stdout.readline().decode():
+        while 'Ready!' not in self.readline():
             pass # wait for everything to boot up
+
+        self.pending = Queue() # (future, reply parser) for every submitted command
+        self.outstanding = 0 # commands without a reply yet
+        self.lock = Lock() # commands need to be written in the same order as they are queued
+        self.reader = Thread(target=self.read, daemon=True)
+        self.reader.start()
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
         self.proc.terminate()
+        self.pending.put((None, None))
+        self.reader.join()
 
-    def solve(self, facecube):
+    def readline(self):
+        line = self.proc.stdout.readline().decode()
+        if line == '':
+            raise RuntimeError('Solver process terminated')
+        return line[:-1] # strip trailing '\n'
+
+    def read(self):
+        while True:
+            future, parse = self.pending.get()
+            if future is None:
+                return
+            try:
+                result = parse()
+            except Exception as e:
+                result = e
+            with self.lock:
+                self.outstanding -= 1
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def submit(self, cmd, parse):
+        future = Future()
+        with self.lock:
+            self.outstanding += 1
+            self.pending.put((future, parse))
+            self.proc.stdin.write(cmd.encode())
+            self.proc.stdin.flush() # command needs to be received instantly
+        return future
+
+    # Whether there are still commands queued, i.e. a new one would have to wait behind them
+    def busy(self):
+        return self.outstanding > 0
+
+    def solve_async(self, facecube, solve_time=None):
         if facecube == '':
-            return None
-        self.proc.stdin.write(('solve %s -1 %d\n' % (facecube, SOLVE_TIME)).encode())
-        self.proc.stdin.flush() # command needs to be received instantly
-        sol = self.proc.stdout.readline().decode()[:-1] # strip trailing '\n'
+            future = Future()
+            future.set_result(None)
+            return future
+        if solve_time is None:
+            solve_time = self.solve_time
+        return self.submit('solve %s -1 %d\n' % (facecube, solve_time), self.read_solution)
+
+    def read_solution(self):
+        sol = self.readline()
         print(sol) # NOTE: here for debugging purposes
-        self.proc.stdout.readline() # clear time taken message
-        self.proc.stdout.readline() # clear "Ready!" message 
+        self.readline() # clear time taken message
+        self.readline() # clear "Ready!" message
         return convert_sol(sol) if 'Error' not in sol else None
 
-    def scramble(self):
-        self.proc.stdin.write(('scramble %d\n' % SCRAMBLE_TIME).encode())
-        self.proc.stdin.flush()
-        scramble = self.proc.stdout.readline().decode()[:-1]
-        self.proc.stdout.readline() # "Ready!"
+    def solve(self, facecube):
+        return self.solve_async(facecube).result()
+
+    # Query the same facecube with several time limits; the resulting solutions are typically
+    # different and may thus be selected by how fast they can be executed
+    def solve_candidates(self, facecube, solve_times=CANDIDATE_TIMES):
+        return [self.solve_async(facecube, solve_time) for solve_time in solve_times]
+
+    def scramble_async(self):
+        return self.submit('scramble %d\n' % SCRAMBLE_TIME, self.read_scramble)
+
+    def read_scramble(self):
+        scramble = self.readline()
+        self.readline() # "Ready!"
         print(scramble)
         return convert_sol(scramble) # scrambling will never fail
 
+    def scramble(self):
+        return self.scramble_async().result()
+
+
+# Manages several solver processes (typically with different thread counts or time limits) and
+# races the same facecube across all of them to get more predictable tail latencies.
+class SolverPool:
+
+    # `configs` is a list of `(n_threads, solve_time)` pairs, one per process
+    def __init__(self, configs, binary='./twophase'):
+        self.solvers = [Solver(n_threads, solve_time, binary) for n_threads, solve_time in configs]
+
+    def __enter__(self):
+        for solver in self.solvers:
+            solver.__enter__()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        for solver in self.solvers:
+            solver.__exit__(exception_type, exception_value, traceback)
+
+    # Without `score`, return the first valid solution. Otherwise, collect solutions until all
+    # solvers are done or `deadline` seconds have passed and return the one with the lowest score
+    # (if none is found by then, we still take the first one that arrives afterwards).
+    # Solvers which lost an earlier race may still be working on it; as every process handles its
+    # requests strictly in order, those are skipped unless all of them are busy.
+    def solve(self, facecube, score=None, deadline=None):
+        if facecube == '':
+            return None
+        start = time.time()
+        solvers = [solver for solver in self.solvers if not solver.busy()] or self.solvers
+        pending = {solver.solve_async(facecube) for solver in solvers}
+
+        best = None
+        while pending:
+            timeout = None
+            if score is not None and deadline is not None and best is not None:
+                timeout = max(deadline - (time.time() - start), 0)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done: # deadline passed
+                break
+            for future in done:
+                sol = future.result()
+                if sol is None:
+                    continue
+                if score is None:
+                    return sol
+                if best is None or score(sol) < score(best):
+                    best = sol
+        return best
+
+    def scramble(self):
+        return self.solvers[0].scramble()
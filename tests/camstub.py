@@ -0,0 +1,108 @@
+# Local stand-in for the IP Webcam app: serves single shots, an MJPEG stream and the torch switches.
+# Stream frames are only sent when pushed explicitly, every frame is a uniform gray image whose
+# brightness identifies it. Single shots have id 0, or 1 while the torch is on.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+import struct
+from threading import Thread
+
+import cv2
+import numpy as np
+
+BOUNDARY = b'frame'
+STEP = 20 # brightness difference between frames with consecutive ids
+
+# With `thumbnail`, an EXIF segment holding another (complete) JPEG is added like many cameras do
+def jpeg(id, thumbnail=False):
+    frame = np.full((48, 64, 3), id * STEP, dtype=np.uint8)
+    data = cv2.imencode('.jpg', frame)[1].tobytes()
+    if thumbnail:
+        exif = b'Exif\0\0' + cv2.imencode('.jpg', frame[::8, ::8])[1].tobytes()
+        data = data[:2] + b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif + data[2:]
+    return data
+
+# Inverse of `jpeg()` (up to compression artifacts)
+def frame_id(frame):
+    return int(round(np.mean(frame) / STEP))
+
+
+class CamStub:
+
+    # All paths are served below `prefix`
+    def __init__(self, prefix=''):
+        self.streams = [] # one queue of pending frames per connected client
+        self.torch = False
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if not self.path.startswith(prefix):
+                    self.send_error(404)
+                    return
+                self.path = self.path[len(prefix):]
+                if self.path == '/video':
+                    stub.stream(self)
+                    return
+                if self.path in ['/enabletorch', '/disabletorch']:
+                    stub.torch = self.path == '/enabletorch'
+                    body = b''
+                elif self.path == '/shot.jpg':
+                    body = jpeg(1 if stub.torch else 0)
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d%s' % (self.server.server_address[1], prefix)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stream(self, handler):
+        frames = Queue()
+        self.streams.append(frames) # before the headers, i.e. before the client sees the stream
+        handler.send_response(200)
+        handler.send_header(
+            'Content-Type', 'multipart/x-mixed-replace; boundary=%s' % BOUNDARY.decode()
+        )
+        handler.end_headers()
+        try:
+            while True:
+                data = frames.get()
+                if data is None:
+                    return
+                handler.wfile.write(data)
+                handler.wfile.flush()
+        except OSError: # client has disconnected
+            pass
+        finally:
+            self.streams.remove(frames)
+
+    # Send frames with the given ids to all connected streams (in a single write)
+    def push(self, *ids, thumbnail=False):
+        jpegs = [jpeg(id, thumbnail) for id in ids]
+        data = b''.join(
+            b'--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n' % (
+                BOUNDARY, len(data), data
+            ) for data in jpegs
+        )
+        for frames in list(self.streams):
+            frames.put(data)
+
+    # End all streams from the server side
+    def end_streams(self):
+        for frames in list(self.streams):
+            frames.put(None)
+
+    def close(self):
+        self.end_streams()
+        self.server.shutdown()
+        self.server.server_close()
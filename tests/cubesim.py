@@ -0,0 +1,36 @@
+# Facelet-level simulation of turning a cube, shared by several tests
+
+from cache import *
+
+SOLVED = ''.join(c * 9 for c in FACES)
+
+
+# Facelet permutation of turning face `f` clockwise, i.e. by -90 degrees around its normal
+def turn_perm(f):
+    n = NORMALS[f]
+    perm = list(range(N_FACELETS))
+    for i, loc in enumerate(LOCS):
+        if sum(a * b for a, b in zip(loc, n)) >= 2: # facelet on the turned layer
+            x, y, z = loc
+            cross = [n[1] * z - n[2] * y, n[2] * x - n[0] * z, n[0] * y - n[1] * x]
+            dot = sum(a * b for a, b in zip(loc, n))
+            perm[i] = LOC_TO_FACELET[tuple(dot * b - c for b, c in zip(n, cross))]
+    return perm
+
+TURN_PERMS = [turn_perm(f) for f in range(len(FACES))]
+
+# Apply moves in the solver's numbering to a facecube
+def apply_moves(facecube, moves):
+    for m in moves:
+        for _ in range(m % 3 + 1):
+            tmp = [''] * N_FACELETS
+            for i, c in enumerate(facecube):
+                tmp[TURN_PERMS[m // 3][i]] = c
+            facecube = ''.join(tmp)
+    return facecube
+
+def invert(moves):
+    return [3 * (m // 3) + 2 - m % 3 for m in reversed(moves)]
+
+def scramble(rng, n=20):
+    return [rng.randrange(15) for _ in range(n)]
@@ -0,0 +1,38 @@
+import random
+
+from cache import *
+from cubesim import *
+
+
+def test_turns():
+    assert apply_moves(SOLVED, [0] * 4) == SOLVED
+    sol = scramble(random.Random(0))
+    assert apply_moves(SOLVED, sol) != SOLVED
+    assert apply_moves(apply_moves(SOLVED, sol), invert(sol)) == SOLVED
+
+def test_symmetric_lookups_solve(tmp_path):
+    rng = random.Random(0)
+    with SolutionCache(str(tmp_path / 'cache.bin'), size=64) as cache:
+        for _ in range(50):
+            moves = scramble(rng)
+            facecube = apply_moves(SOLVED, moves)
+            cache.put(facecube, invert(moves))
+            for s in range(N_SYMS):
+                sym = transform(facecube, s)
+                sol = cache.get(sym)
+                assert sol is not None
+                assert apply_moves(sym, sol) == SOLVED
+
+def test_lru_order_survives_reopen(tmp_path):
+    path = str(tmp_path / 'cache.bin')
+    rng = random.Random(1)
+    cubes = [apply_moves(SOLVED, scramble(rng)) for _ in range(4)]
+    with SolutionCache(path, size=3) as cache:
+        for facecube in cubes[:3]:
+            cache.put(facecube, [0])
+        cache.get(cubes[0]) # now cube 1 is the least recently used one
+    with SolutionCache(path, size=3) as cache:
+        cache.put(cubes[3], [0])
+        assert cache.get(cubes[1]) is None
+        for facecube in [cubes[0], cubes[2], cubes[3]]:
+            assert cache.get(facecube) == [0]
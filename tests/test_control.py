@@ -0,0 +1,45 @@
+import pytest
+
+import ev3
+from control import *
+from sim import *
+
+
+# Brick which replies an error to its `fail`-th command (counting from 1)
+class FailingBrick(SimBrick):
+
+    def __init__(self, fail):
+        super().__init__()
+        self.fail = fail
+
+    def run_cmd(self, cmd):
+        reply = super().run_cmd(cmd)
+        if self.executed == self.fail:
+            reply = reply[:4] + ev3._DIRECT_REPLY_ERROR + reply[5:]
+        return reply
+
+
+# Moves alternating between all three bricks
+SOL = [0, 3, 6] * 5 + [0]
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_stops_after_failed_command(parallel):
+    bricks = [SimBrick(), FailingBrick(1), SimBrick()]
+    robot = Robot(parallel=parallel, devices=bricks)
+    with pytest.raises(ev3.DirCmdError):
+        robot.execute(SOL)
+    time.sleep(.1) # anything still sent would have been executed by now
+    assert sum(brick.executed for brick in bricks) == 2
+
+def test_parallel_runs_again_after_failure():
+    bricks = [SimBrick(), FailingBrick(2), SimBrick()]
+    robot = Robot(parallel=True, devices=bricks)
+    with pytest.raises(ev3.DirCmdError):
+        robot.execute(SOL)
+    executed = sum(brick.executed for brick in bricks)
+    assert executed == 5
+
+    timings = []
+    robot.execute(SOL, timings=timings)
+    assert sum(brick.executed for brick in bricks) == executed + len(SOL)
+    assert len(timings) == len(SOL)
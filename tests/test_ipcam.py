@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+
+from camstub import *
+from scan import *
+
+
+@pytest.fixture
+def stub():
+    stub = CamStub()
+    yield stub
+    stub.close()
+
+@pytest.fixture
+def cam(stub):
+    with IpCamStream(stub.url, timeout=2.) as cam:
+        yield cam
+
+
+def test_single_shot(stub):
+    cam = IpCam(stub.url)
+    assert frame_id(cam.frame()) == 0
+    cam.flash(True)
+    assert stub.torch
+
+def test_flash_controller():
+    stub = CamStub(prefix='/cam')
+    flasher = FlashController(IpCam(stub.url))
+    stub.torch = True # f.i. left on by a crashed run
+    assert flasher.switch(False).result()
+    assert not stub.torch
+    assert flasher.switch(True).result() # confirmed by the brighter shot
+    assert stub.torch
+    flasher.close()
+    stub.close()
+
+def test_keeps_only_latest_frame(cam, stub):
+    start = time.time()
+    stub.push(1, 2, 3, 4, 5)
+    assert frame_id(cam.frame(after=start)) == 5
+    time.sleep(.1)
+    assert frame_id(cam.frame(after=start)) == 5
+
+@pytest.mark.parametrize('chunk', [64, 1 << 14]) # parts are split across reads or not
+def test_frames_with_thumbnail(stub, chunk):
+    assert frame_id(cv2.imdecode(np.frombuffer(jpeg(3, True), dtype=np.uint8), 1)) == 3
+    with IpCamStream(stub.url, chunk=chunk, timeout=2.) as cam:
+        start = time.time()
+        stub.push(3, thumbnail=True)
+        assert frame_id(cam.frame(after=start)) == 3
+        stub.push(4, 5, thumbnail=True)
+        time.sleep(.1)
+        assert frame_id(cam.frame(after=start)) == 5
+
+def test_waits_for_frame_after(cam, stub):
+    stub.push(1)
+    assert frame_id(cam.frame(after=0.)) == 1
+
+    after = time.time()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        frame = pool.submit(cam.frame, after)
+        time.sleep(.1)
+        assert not frame.done() # frame 1 is too old
+        stub.push(2)
+        assert frame_id(frame.result(timeout=1.)) == 2
+
+def test_frame_after_torch_switch(cam, stub):
+    stub.push(1)
+    cam.frame(after=0.)
+    cam.switched = time.time()
+    stub.push(2)
+    assert frame_id(cam.frame()) == 2
+
+def test_stop(stub):
+    cam = IpCamStream(stub.url, timeout=2.)
+    cam.start()
+    thread = cam.thread
+    tick = time.time()
+    cam.stop() # grabber is blocked reading as no frames are sent
+    assert not thread.is_alive()
+    assert time.time() - tick < 1.
+    with pytest.raises(RuntimeError):
+        cam.frame(after=0.)
+
+def test_not_started(stub):
+    cam = IpCamStream(stub.url)
+    with pytest.raises(RuntimeError):
+        cam.frame()
+    cam.stop()
+
+def test_stream_ended_by_server(cam, stub):
+    stub.push(1)
+    cam.frame(after=0.)
+    stub.end_streams()
+    tick = time.time()
+    with pytest.raises(RuntimeError):
+        cam.frame(after=time.time())
+    assert time.time() - tick < 1. # noticed without waiting for the timeout
@@ -0,0 +1,24 @@
+from motion import *
+
+
+def test_tune_reproduces_waitdeg():
+    assert MotionSim(angles=waitdeg_angles()).tune() == WAITDEG
+
+def test_waits_follow_the_physics():
+    waits = MotionSim().tune()
+    # Slowly accelerating faces take longer to reach their neighbours, hence can start earlier
+    slow = MotionSim(motor=lambda: PhysicsMotor(accel=ACCEL / 2)).tune()
+    assert slow != waits
+    assert all(s <= w for ss, ws in zip(slow, waits) for s, w in zip(ss, ws))
+
+def test_missing_angles_fall_back_to_waitdeg():
+    angles = [list(row) for row in COLLISION_ANGLES]
+    angles[0][1] = None
+    assert MotionSim(angles=angles).angles[0][1] == waitdeg_angles()[0][1]
+    assert MotionSim(angles=angles).angles[1] == COLLISION_ANGLES[1]
+
+def test_no_collisions_with_waitdeg():
+    msim = MotionSim(angles=waitdeg_angles())
+    rng = random.Random(0)
+    for _ in range(20):
+        assert msim.run_solution([rng.randrange(15) for _ in range(20)])[1] == []
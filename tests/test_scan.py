@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+
+from cubesim import *
+from scan import *
+
+
+# Every 8-bit OpenCV hue with a couple of saturations and values
+HSVS = np.array([
+    (h, s, v) for h in range(180) for s in [0, 1, 128, 255] for v in [0, 77, 255]
+], dtype=np.uint8)
+
+def test_transforms_match_per_row():
+    expected = np.array([transform(hsv) for hsv in HSVS / [180, 255, 255]])
+    assert np.array_equal(transform_all(HSVS / [180, 255, 255]), expected)
+    assert np.array_equal(transform_lut(HSVS), expected)
+
+def test_matcher_without_lut():
+    bgrs = np.random.default_rng(0).integers(0, 256, (54, 3), dtype=np.uint8)
+    assert np.array_equal(ColorMatcher(lut=False).transform(bgrs), ColorMatcher().transform(bgrs))
+    assert ColorMatcher(lut=False).match(bgrs) == ColorMatcher().match(bgrs)
+
+
+# Rough BGR values of the cube's colors as seen by the camera (in the order of `FACES`)
+FACE_BGRS = np.array([
+    (160, 60, 20), (40, 200, 220), (40, 30, 150), (60, 130, 30), (200, 200, 200), (30, 110, 230)
+])
+
+# Simulated scan of a facecube: slightly varying lighting plus noise on every facelet
+def scan(facecube, rng):
+    bgrs = FACE_BGRS[[FACES.index(c) for c in facecube]] * rng.uniform(.9, 1.05)
+    return np.clip(bgrs + rng.normal(0, 6, bgrs.shape), 0, 255).astype(np.uint8)
+
+def test_match_scrambled_cubes():
+    rng = random.Random(0)
+    nprng = np.random.default_rng(0)
+    matcher = ColorMatcher()
+    for _ in range(200):
+        facecube = apply_moves(SOLVED, scramble(rng))
+        bgrs = scan(facecube, nprng)
+        assert matcher.match(bgrs) == facecube
+        assert matcher.match(bgrs, fixed_centers=False) == facecube
+
+# One facelet is tinted so strongly towards another color (f.i. by a reflection) that it is closer
+# to a wrong center; only the constraints of a valid cube can resolve this
+def test_match_misleading_facelet():
+    rng = random.Random(2)
+    nprng = np.random.default_rng(2)
+    matcher = ColorMatcher()
+    for _ in range(100):
+        facecube = apply_moves(SOLVED, scramble(rng))
+        bgrs = scan(facecube, nprng)
+        f = rng.choice([f for f in range(N_FACELETS) if f not in CENTERS])
+        other = (FACES.index(facecube[f]) + rng.randrange(1, 6)) % 6
+        bgrs[f] = .3 * bgrs[f] + .7 * FACE_BGRS[other]
+        transformed = matcher.transform(bgrs)
+        nearest = np.argmin(distances(transformed[f:(f + 1)], transformed[CENTERS]))
+        assert FACES[nearest] != facecube[f]
+        assert matcher.match(bgrs) == facecube
+        assert matcher.match(bgrs, fixed_centers=False) == facecube
+
+def test_match_many():
+    rng = random.Random(1)
+    nprng = np.random.default_rng(1)
+    facecubes = [apply_moves(SOLVED, scramble(rng)) for _ in range(20)]
+    bgrs = np.stack([scan(facecube, nprng) for facecube in facecubes])
+    assert ColorMatcher().match_many(bgrs) == facecubes
+    assert ColorMatcher().match_many(bgrs, fixed_centers=False) == facecubes
@@ -0,0 +1,52 @@
+import os
+import time
+
+from solve import *
+
+STUB = os.path.join(os.path.dirname(__file__), 'twophase_stub.py')
+FACECUBE = 'UUUUUUUUURRRRRRRRRFFFFFFFFFDDDDDDDDDLLLLLLLLLBBBBBBBBB'
+
+
+def pool(configs):
+    return SolverPool(configs, binary=STUB)
+
+
+def test_first_valid_solution_wins():
+    with pool([(3, 200), (5, 20)]) as solvers:
+        tick = time.time()
+        assert len(solvers.solve(FACECUBE)) == 5
+        assert time.time() - tick < .15
+
+def test_best_score_until_deadline():
+    with pool([(3, 100), (5, 20)]) as solvers:
+        assert len(solvers.solve(FACECUBE, score=len, deadline=.5)) == 3
+    with pool([(3, 300), (5, 20)]) as solvers:
+        tick = time.time()
+        assert len(solvers.solve(FACECUBE, score=len, deadline=.1)) == 5
+        assert time.time() - tick < .25
+
+def test_failed_solves_are_ignored():
+    with pool([(0, 10), (4, 50)]) as solvers:
+        assert len(solvers.solve(FACECUBE)) == 4
+        assert len(solvers.solve(FACECUBE, score=len, deadline=.5)) == 4
+    with pool([(0, 10), (0, 20)]) as solvers:
+        assert solvers.solve(FACECUBE) is None
+        assert solvers.solve(FACECUBE, score=len, deadline=.5) is None
+    with pool([(4, 10)]) as solvers:
+        assert solvers.solve('') is None
+
+def test_busy_solvers_are_skipped():
+    with pool([(3, 300), (5, 20)]) as solvers:
+        solvers.solve(FACECUBE) # the first solver is still busy with this afterwards
+        assert solvers.solvers[0].busy()
+        tick = time.time()
+        assert len(solvers.solve(FACECUBE, score=len, deadline=.5)) == 5
+        assert time.time() - tick < .15
+
+        time.sleep(.3)
+        assert not any(solver.busy() for solver in solvers.solvers)
+        assert len(solvers.solve(FACECUBE, score=len, deadline=.5)) == 3
+
+def test_scramble():
+    with pool([(3, 10)]) as solvers:
+        assert solvers.scramble() == [0, 3]
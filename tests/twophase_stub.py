@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# Stand-in for the interactive mode of the "twophase" solver: `twophase_stub.py -t N interactive`.
+# Every solve takes exactly its time limit (in ms) and returns a solution of N moves, N = 0 gives an
+# error reply instead.
+
+import sys
+import time
+
+n_moves = int(sys.argv[sys.argv.index('-t') + 1])
+
+print('Ready!', flush=True)
+for line in sys.stdin:
+    args = line.split()
+    if args[0] == 'solve':
+        time.sleep(int(args[3]) / 1000)
+        if n_moves == 0:
+            print('Error 8', flush=True)
+        else:
+            print(' '.join(['U', 'R'][i % 2] for i in range(n_moves)), flush=True)
+        print('Done (%sms)' % args[3], flush=True)
+    elif args[0] == 'scramble':
+        print('U R', flush=True)
+    print('Ready!', flush=True)
@@ -0,0 +1,34 @@
+# Print a trace of the communication with the bricks as recorded by an `ev3.WireTrace`:
+# `python wiredump.py TRACE`
+
+import sys
+
+import ev3
+
+
+def dump(trace, file=sys.stdout):
+    entries = trace.entries()
+    if len(entries) == 0:
+        return
+    if entries[0][0] > 1:
+        print('(%d older frames dropped)' % (entries[0][0] - 1), file=file)
+
+    start = entries[0][1]
+    sent = {} # (source, counter) -> send time, to show the round-trip time of replies
+    for _, stamp, source, direction, len_frame, frame in entries:
+        line = '%12.3fms %d %s %s' % (
+            (stamp - start) / 1e6, source,
+            'Sent' if direction == ev3.TRACE_SENT else 'Recv', ev3.format_frame(frame)
+        )
+        if len_frame > len(frame):
+            line += '.. (%d bytes)' % len_frame
+        key = (source, frame[2:4])
+        if direction == ev3.TRACE_SENT:
+            sent[key] = stamp
+        elif key in sent:
+            line += ' after %.3fms' % ((stamp - sent.pop(key)) / 1e6)
+        print(line, file=file)
+
+
+if __name__ == '__main__':
+    dump(ev3.WireTrace.load(sys.argv[1]))